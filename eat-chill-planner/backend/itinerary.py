@@ -0,0 +1,211 @@
+# File: backend/itinerary.py
+# Quản lý lịch trình + các đoạn đường (leg) giữa các điểm
+#
+# Mỗi item có 1 leg: đoạn đường từ điểm trước đó (hoặc điểm xuất phát) đến item.
+# Leg được lưu lại trong store, khi thêm/xóa/sửa item chỉ tính lại những leg
+# có điểm đầu/cuối thay đổi (tối đa 2 leg cạnh item đó) thay vì route lại cả lịch trình.
+# Leg "fallback" (đường thẳng khi OSRM lỗi/quá thời gian) không được giữ: lần đọc sau route lại.
+
+import heapq
+
+from geopy.distance import geodesic
+
+from backend.osm_search import get_osrm_route
+from backend.store import store
+
+DEFAULT_ORIGIN = (10.762622, 106.660172)  # Vị trí xuất phát mặc định (Quận 10)
+ORIGIN_LEG_TTL = 24 * 3600  # Đoạn đầu tính từ vị trí riêng của từng client, cache theo (vị trí, điểm đến)
+
+
+def sorted_items(items: list) -> list:
+    """Sort itinerary items by start time (stable on insertion order)."""
+    return sorted(items, key=lambda x: x['start_time'])
+
+
+def find_conflict(items: list, start_time: str, end_time: str, exclude_id: int = None):
+    """Return the first item overlapping [start_time, end_time), or None."""
+    for existing_item in items:
+        if exclude_id is not None and existing_item.get('id') == exclude_id:
+            continue
+        existing_start = existing_item.get('start_time')
+        existing_end = existing_item.get('end_time')
+
+        # Overlap occurs if: new_start < existing_end AND new_end > existing_start
+        if start_time < existing_end and end_time > existing_start:
+            return existing_item
+    return None
+
+
+def find_all_conflicts(items: list) -> list:
+    """Every overlapping pair (i, j) of ``items`` with one sort-and-sweep pass.
+
+    O(n log n + k) for k conflicts, instead of checking every pair. Uses the same
+    overlap rule as ``find_conflict``; items must have start_time <= end_time.
+    """
+    order = sorted(range(len(items)), key=lambda i: (items[i]['start_time'], items[i]['end_time']))
+    active = []  # heap of (end_time, index) của các hoạt động chưa kết thúc
+    conflicts = []
+    for i in order:
+        start_time = items[i]['start_time']
+        while active and active[0][0] <= start_time:
+            heapq.heappop(active)
+        for _, j in active:
+            conflicts.append((j, i))
+        heapq.heappush(active, (items[i]['end_time'], i))
+    return conflicts
+
+
+def plan_bulk_import(existing: list, new_items: list, best_effort: bool) -> dict:
+    """Decide which ``new_items`` can be added next to ``existing`` without overlaps.
+
+    Atomic mode accepts all or nothing. Best-effort mode drops items that clash with
+    existing ones, then keeps the earliest-starting item of each clash among the batch.
+    Returns ``{"accepted": [index...], "rejected": {index: reason}, "conflicts": [...]}``.
+    """
+    rejected = {}
+    valid = []
+    for index, item in enumerate(new_items):
+        if item['end_time'] < item['start_time']:
+            rejected[index] = "Giờ kết thúc phải sau giờ bắt đầu."
+        else:
+            valid.append(index)
+
+    combined = existing + [new_items[i] for i in valid]
+    labels = [("existing", item.get('id')) for item in existing] + [("new", i) for i in valid]
+
+    conflicts = []
+    clashes_existing = set()
+    for a, b in find_all_conflicts(combined):
+        (kind_a, ref_a), (kind_b, ref_b) = labels[a], labels[b]
+        if kind_a == kind_b == "existing":
+            continue
+        conflicts.append({
+            "a": {"source": kind_a, "ref": ref_a, "name": combined[a].get('name'),
+                  "start_time": combined[a]['start_time'], "end_time": combined[a]['end_time']},
+            "b": {"source": kind_b, "ref": ref_b, "name": combined[b].get('name'),
+                  "start_time": combined[b]['start_time'], "end_time": combined[b]['end_time']},
+        })
+        if kind_a == "existing":
+            clashes_existing.add(ref_b)
+        if kind_b == "existing":
+            clashes_existing.add(ref_a)
+
+    if not best_effort:
+        if conflicts or rejected:
+            for index in valid:
+                rejected.setdefault(index, "Lô dữ liệu có xung đột, không thêm hoạt động nào.")
+            return {"accepted": [], "rejected": rejected, "conflicts": conflicts}
+        return {"accepted": valid, "rejected": rejected, "conflicts": conflicts}
+
+    accepted = []
+    last_end = ""
+    for index in sorted(valid, key=lambda i: (new_items[i]['start_time'], new_items[i]['end_time'])):
+        item = new_items[index]
+        if index in clashes_existing:
+            rejected[index] = "Xung đột với hoạt động đã có trong lịch trình."
+        elif accepted and item['start_time'] < last_end:
+            rejected[index] = "Xung đột với hoạt động khác trong lô dữ liệu."
+        else:
+            accepted.append(index)
+            last_end = max(last_end, item['end_time'])
+    return {"accepted": sorted(accepted), "rejected": rejected, "conflicts": conflicts}
+
+
+def itinerary_etag(origin: tuple = None) -> str:
+    """ETag of the itinerary view seen from ``origin``: changes with every mutation.
+
+    Includes the store epoch, so a counter restarting with a new store never matches an old ETag.
+    """
+    lat, lon = origin or DEFAULT_ORIGIN
+    return f'"itinerary-{store.epoch}-v{store.itinerary_version()}-{lat:.6f}_{lon:.6f}"'
+
+
+def itinerary_state() -> dict:
+    """What change notifications report: the store epoch and the itinerary version counter."""
+    return {"epoch": store.epoch, "version": store.itinerary_version()}
+
+
+def is_fallback_leg(leg: dict) -> bool:
+    """True for a straight-line leg stored while OSRM could not route it."""
+    return leg.get("source") == "fallback"
+
+
+def compute_leg(item_id: int, start: tuple, end: tuple) -> dict:
+    """Route one leg with OSRM (falls back to a straight line inside get_osrm_route)."""
+    route_data = get_osrm_route(start[0], start[1], end[0], end[1])
+    try:
+        step_distance = round(geodesic(start, end).km, 2)
+    except:
+        step_distance = 0
+    return {
+        "item_id": item_id,
+        "from": list(start),
+        "to": list(end),
+        "route": route_data.get("route", [start, end]),
+        "distance_km": route_data.get("distance_km", step_distance),
+        "duration_seconds": route_data.get("duration_seconds", 0),
+        "source": route_data.get("source", "fallback"),
+        "step_distance": step_distance,
+    }
+
+
+def sync_legs() -> dict:
+    """Bring stored legs in line with the current itinerary order.
+
+    Only legs whose endpoints changed, or that are straight-line fallbacks from an
+    OSRM outage, are routed again. Returns the delta:
+    ``{"changed": [leg, ...], "removed": [item_id, ...]}``.
+    """
+    items = sorted_items(store.list_itinerary())
+    legs = store.get_legs()
+
+    changed = []
+    prev_loc = DEFAULT_ORIGIN
+    for item in items:
+        current_loc = (item['lat'], item['lon'])
+        leg = legs.get(item['id'])
+        if (leg is None or is_fallback_leg(leg)
+                or tuple(leg["from"]) != tuple(prev_loc) or tuple(leg["to"]) != current_loc):
+            leg = compute_leg(item['id'], prev_loc, current_loc)
+            store.set_leg(item['id'], leg)
+            changed.append(leg)
+        prev_loc = current_loc
+
+    item_ids = {item['id'] for item in items}
+    removed = [item_id for item_id in legs if item_id not in item_ids]
+    if removed:
+        store.delete_legs(removed)
+    return {"changed": changed, "removed": removed}
+
+
+def origin_leg(origin: tuple, item: dict) -> dict:
+    """Leg from a client's own ``origin`` to ``item`` (cached, never written to the shared legs).
+
+    Fallback legs are not cached, so the next request routes them again.
+    """
+    key = f"{origin[0]:.6f},{origin[1]:.6f}|{item['lat']:.6f},{item['lon']:.6f}"
+    leg = store.cache_get("origin_leg", key)
+    if leg is None:
+        leg = compute_leg(item['id'], origin, (item['lat'], item['lon']))
+        if not is_fallback_leg(leg):
+            store.cache_set("origin_leg", key, leg, ORIGIN_LEG_TTL)
+    return {**leg, "item_id": item['id']}
+
+
+def itinerary_with_legs(origin: tuple = None) -> dict:
+    """Sorted itinerary plus legs in the same order (each item keeps its step_distance).
+
+    With ``origin``, the first leg starts there instead of at the default origin;
+    the other legs do not depend on it.
+    """
+    origin = tuple(origin) if origin else DEFAULT_ORIGIN
+    items = sorted_items(store.list_itinerary())
+    legs = store.get_legs()
+    ordered_legs = []
+    for item in items:
+        leg = legs.get(item['id'], {})
+        if not ordered_legs and origin != DEFAULT_ORIGIN:
+            leg = origin_leg(origin, item)
+        item['step_distance'] = leg.get("step_distance", 0)  # Khoảng cách từ điểm trước đến điểm này
+        ordered_legs.append(leg)
+    return {"itinerary": items, "legs": ordered_legs, "origin": list(origin)}
@@ -0,0 +1,60 @@
+# File: backend/itinerary_export.py
+# Xuất lịch trình dạng JSON / iCalendar theo kiểu streaming (từng item một)
+
+import datetime
+import json
+
+EXPORT_FIELDS = ("id", "name", "start_time", "end_time", "place_name", "lat", "lon")
+
+
+def iter_json(items):
+    """Yield a ``{"itinerary": [...]}`` JSON document chunk by chunk."""
+    yield '{"itinerary": ['
+    first = True
+    for item in items:
+        chunk = json.dumps({key: item.get(key) for key in EXPORT_FIELDS}, ensure_ascii=False)
+        yield chunk if first else "," + chunk
+        first = False
+    yield "]}"
+
+
+def _ics_escape(text: str) -> str:
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def _ics_fold(line: str) -> str:
+    """Fold a content line at 75 octets (RFC 5545 §3.1), without splitting UTF-8 characters."""
+    out, current = [], ""
+    for ch in line:
+        if len((current + ch).encode("utf-8")) > 75:
+            out.append(current)
+            current = " " + ch
+        else:
+            current += ch
+    out.append(current)
+    return "\r\n".join(out) + "\r\n"
+
+
+def _ics_datetime(day: str, hhmm: str) -> str:
+    return day.replace("-", "") + "T" + hhmm.replace(":", "")[:4] + "00"
+
+
+def iter_ics(items, day: str):
+    """Yield an iCalendar document; times are floating local times on ``day`` (YYYY-MM-DD)."""
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Eat & Chill Planner//VI\r\nCALSCALE:GREGORIAN\r\n"
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    for item in items:
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:eat-chill-{item.get('id')}-{day}@eat-chill-planner",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{_ics_datetime(day, item['start_time'])}",
+            f"DTEND:{_ics_datetime(day, item['end_time'])}",
+            f"SUMMARY:{_ics_escape(item.get('name', ''))}",
+            f"LOCATION:{_ics_escape(item.get('place_name', ''))}",
+            f"GEO:{item.get('lat')};{item.get('lon')}",
+            "END:VEVENT",
+        ]
+        yield "".join(_ics_fold(line) for line in lines)
+    yield "END:VCALENDAR\r\n"
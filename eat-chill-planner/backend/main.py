@@ -1,10 +1,75 @@
 # File: backend/main.py
-from fastapi import FastAPI
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from geopy.distance import geodesic
-from backend.osm_search import search_osm, get_osrm_route, matches_food_filters, matches_entertainment_filters
+from backend.osm_search import (
+    search_osm, search_osm_overpass_multi, rank_place_pairs_by_travel_time, rank_places_by_duration, get_osrm_route,
+    group_search_area, rank_places_for_group,
+    upstream_flights,
+)
+from backend.itinerary import (
+    find_conflict, plan_bulk_import, sync_legs, itinerary_with_legs,
+    itinerary_etag, itinerary_state, is_fallback_leg,
+)
+from backend.itinerary_export import iter_ics, iter_json
+from backend.name_index import poi_index
+from backend.place_filters import filter_places, rank_by_relevance
+from backend.profiling import ProfiledRoute, ProfilingMiddleware, admin_token_ok, profile_store, profiling_config
+from backend.store import store
 
 app = FastAPI()
+# Profile request theo yêu cầu (tắt mặc định, xem backend/profiling.py); phải đặt trước khi khai báo route
+app.router.route_class = ProfiledRoute
+app.add_middleware(ProfilingMiddleware)
+
+# Nạp sẵn model chat vào Ollama khi server khởi động để tin nhắn đầu tiên không phải chờ load model
+WARM_UP_OLLAMA = os.environ.get("EAT_CHILL_WARMUP", "1") != "0"
+
+@app.on_event("startup")
+def warm_up_ollama():
+    if WARM_UP_OLLAMA:
+        from chatbot.bot_engine import warm_up_model
+        threading.Thread(target=warm_up_model, daemon=True).start()
+
+# Khoảng thời gian kiểm tra phiên bản lịch trình / gửi keep-alive cho /api/itinerary/events
+EVENTS_POLL_SECONDS = 0.5
+EVENTS_HEARTBEAT_SECONDS = 15
+
+
+def content_etag(payload) -> str:
+    """Strong ETag from the JSON content of a response."""
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(http_request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match already names ``etag`` (GET/HEAD only)."""
+    if http_request.method not in ("GET", "HEAD"):
+        return False  # Với POST, If-None-Match khớp phải trả 412 chứ không phải 304 -> chỉ gửi ETag
+    header = http_request.headers.get("if-none-match", "")
+    candidates = {tag.removeprefix("W/") for tag in re.findall(r'(?:W/)?"[^"]*"|\*', header)}
+    return "*" in candidates or etag in candidates
+
+
+def with_etag(http_request: Request, response: Response, payload, etag: str = None):
+    """Return ``payload`` with an ETag header, or an empty 304 if the client has it already."""
+    etag = etag or content_etag(payload)
+    if etag_matches(http_request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return payload
+
 
 class SearchRequest(BaseModel):
     lat: float
@@ -12,46 +77,152 @@ class SearchRequest(BaseModel):
     category: str = None
     keyword: str = None
     filters: dict = None
+    rank_by: str = "distance"  # "distance" | "duration" | "relevance"
+    duration_top_n: int = 20   # Số ứng viên gần nhất được lấy thời gian di chuyển
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Eat & Chill API"}
 
 @app.post("/api/search")
-def search_api(request: SearchRequest):
+def search_api(request: SearchRequest, http_request: Request, response: Response):
     # Use OpenStreetMap globally for search with filter matching
     query = request.keyword if request.keyword else (request.category or "")
     raw_results = search_osm(query, request.lat, request.lon, radius_km=5, limit=50)
     
+    # Keyword: match by name/cuisine over every POI seen so far (index is warmed by the search above)
+    if request.keyword:
+        keyword_results = poi_index.search_near(request.keyword, request.lat, request.lon, radius_km=5, limit=50)
+        if keyword_results:
+            raw_results = keyword_results
+    
     # Apply filter matching if filters provided
+    results = raw_results
     if request.filters:
-        category = request.filters.get("category", "")
-        filtered_results = []
-        
-        for place in raw_results:
-            # Extract tags from place dict
-            place_tags = place.get("tags", {})
-            
-            if category == "Ăn uống":
-                if matches_food_filters(place_tags, request.filters):
-                    filtered_results.append(place)
-            elif category == "Giải trí":
-                if matches_entertainment_filters(place_tags, request.filters):
-                    filtered_results.append(place)
-            else:
-                filtered_results.append(place)
-        
-        # Return top results after filtering
-        return {"places": filtered_results[:20], "source": "OpenStreetMap"}
+        results = filter_places(raw_results, request.filters.get("category", ""), request.filters)
+    
+    # Optional: re-rank the nearest candidates by OSRM driving time (one table request)
+    if request.rank_by == "duration":
+        results = rank_places_by_duration(results[:request.duration_top_n], (request.lat, request.lon))
+    elif request.rank_by == "relevance":
+        results = rank_by_relevance(results, request.keyword, request.filters, limit=20)
     
-    return {"places": raw_results[:20], "source": "OpenStreetMap"}
+    # Return top results after filtering
+    return with_etag(http_request, response, {"places": results[:20], "source": "OpenStreetMap"})
+
+
+# Tìm chỗ hẹn cho nhóm: tối đa số người / thời gian trả lời (Overpass + OSRM)
+MAX_GROUP_ORIGINS = 10
+MAX_GROUP_RADIUS_KM = 20
+GROUP_SEARCH_BUDGET_MS = 4000
+
+class GroupSearchRequest(BaseModel):
+    origins: list[tuple[float, float]]  # [[lat, lon], ...] vị trí xuất phát của từng người (sai dạng -> 422)
+    category: str = None
+    keyword: str = None
+    filters: dict = None
+    radius_km: float = 3         # Bán kính thêm quanh vùng bao các vị trí
+    candidate_limit: int = 200
+    objective: str = "minimax"   # "minimax" (chuyến xa nhất ngắn nhất) | "total" (tổng thời gian)
+    top_k: int = 20
+    budget_ms: int = GROUP_SEARCH_BUDGET_MS
+
+@app.post("/api/search/group")
+def group_search_api(request: GroupSearchRequest):
+    """Meetup places for several origins, ranked by everyone's driving time."""
+    started = time.monotonic()
+    if not 1 <= len(request.origins) <= MAX_GROUP_ORIGINS:
+        return {"status": "error", "message": f"Cần từ 1 đến {MAX_GROUP_ORIGINS} vị trí xuất phát."}
+    if request.objective not in ("minimax", "total"):
+        return {"status": "error", "message": "objective phải là 'minimax' hoặc 'total'."}
+    origins = request.origins
+
+    # Ứng viên quanh trọng tâm của nhóm, bán kính đủ bao tất cả mọi người
+    centroid, radius_km = group_search_area(origins, request.radius_km)
+    radius_km = min(radius_km, MAX_GROUP_RADIUS_KM)
+    query = request.keyword if request.keyword else (request.category or "")
+    candidates = search_osm(query, centroid[0], centroid[1], radius_km=radius_km, limit=request.candidate_limit)
+    if request.filters:
+        candidates = filter_places(candidates, request.filters.get("category", ""), request.filters)
+
+    # Phần thời gian còn lại dành cho OSRM; chậm quá thì ước lượng theo đường chim bay
+    remaining = max(0.0, request.budget_ms / 1000 - (time.monotonic() - started))
+    places = rank_places_for_group(candidates, origins, request.objective, request.top_k, budget_seconds=remaining)
+    return {
+        "places": places,
+        "centroid": list(centroid),
+        "radius_km": round(radius_km, 2),
+        "objective": request.objective,
+        "candidates": len(candidates),
+        "source": "OpenStreetMap",
+    }
+
+
+# Thời gian trả lời tối đa của plan-search (Overpass + OSRM), quá thì ước lượng theo đường chim bay
+PLAN_SEARCH_BUDGET_MS = 4000
+# Giới hạn từ phía server: ma trận cặp là len(food) × len(chill), top_k quyết định số cặp hỏi OSRM
+MAX_PLAN_RADIUS_KM = 10
+MAX_PLAN_LIMIT_PER_SIDE = 500
+MAX_PLAN_TOP_K = 50
+
+class PlanSearchRequest(BaseModel):
+    lat: float
+    lon: float
+    food_filters: dict = None
+    chill_filters: dict = None
+    radius_km: float = 5
+    limit_per_side: int = 200
+    top_k: int = 10
+    budget_ms: int = PLAN_SEARCH_BUDGET_MS
+
+@app.post("/api/plan-search")
+def plan_search_api(request: PlanSearchRequest):
+    """Search food + entertainment in one go and return "eat then chill" pairs by driving time."""
+    started = time.monotonic()
+    radius_km = min(request.radius_km, MAX_PLAN_RADIUS_KM)
+    limit_per_side = min(request.limit_per_side, MAX_PLAN_LIMIT_PER_SIDE)
+    top_k = min(request.top_k, MAX_PLAN_TOP_K)
+    candidates = search_osm_overpass_multi(
+        {"food": "Ăn uống", "chill": "Giải trí"},
+        request.lat, request.lon, radius_km, limit_per_side
+    )
+    food = candidates["food"]
+    chill = candidates["chill"]
+    if request.food_filters:
+        food = filter_places(food, "Ăn uống", request.food_filters)
+    if request.chill_filters:
+        chill = filter_places(chill, "Giải trí", request.chill_filters)
+
+    # Xếp theo đường chim bay để lọc trước, rồi xếp lại theo thời gian lái xe OSRM trong phần thời gian còn lại
+    remaining = max(0.0, request.budget_ms / 1000 - (time.monotonic() - started))
+    pairs = rank_place_pairs_by_travel_time(food, chill, (request.lat, request.lon), top_k,
+                                            budget_seconds=remaining)
+    return {
+        "pairs": [
+            {
+                "food": pair["first"],
+                "chill": pair["second"],
+                "food_distance_km": pair["first_distance_km"],
+                "hop_distance_km": pair["hop_distance_km"],
+                "total_distance_km": pair["total_distance_km"],
+                "food_minutes": pair["first_minutes"],
+                "hop_minutes": pair["hop_minutes"],
+                "total_minutes": pair["total_minutes"],
+                "estimated": pair["estimated"],
+            }
+            for pair in pairs
+        ],
+        "food_count": len(food),
+        "chill_count": len(chill),
+        "radius_km": radius_km,
+        "source": "OpenStreetMap",
+    }
 
 # Thêm vào backend/main.py
 from pydantic import BaseModel
 
-# Biến toàn cục lưu lịch trình tạm trong RAM (Để đơn giản hóa, tắt server là mất)
-# Nếu muốn lưu lâu dài thì dùng MongoDB như bài trước
-current_itinerary = []
+# Lịch trình lưu trong backend.store (SQLite) để nhiều worker dùng chung.
+# Mặc định là in-memory (tắt server là mất), xem EAT_CHILL_STORE_PATH trong store.py
 
 class ItineraryItem(BaseModel):
     name: str
@@ -61,62 +232,142 @@ class ItineraryItem(BaseModel):
     lat: float  # Thêm tọa độ
     lon: float  # Thêm tọa độ
 
+def _conflict_message(existing_item: dict) -> str:
+    return (f"Xung đột thời gian! Hoạt động '{existing_item.get('name')}' chạy từ "
+            f"{existing_item.get('start_time')} đến {existing_item.get('end_time')}.")
+
 @app.get("/api/itinerary")
-def get_itinerary():
-    # Sắp xếp theo giờ bắt đầu
-    sorted_list = sorted(current_itinerary, key=lambda x: x['start_time'])
-    
-    # Tính toán khoảng cách tích lũy
-    result_with_distance = []
-    prev_loc = (10.762622, 106.660172) # Vị trí xuất phát mặc định (Quận 10)
-    
-    for item in sorted_list:
-        current_loc = (item['lat'], item['lon'])
-        try:
-            # Tính khoảng cách từ điểm trước đến điểm này
-            dist = round(geodesic(prev_loc, current_loc).km, 2)
-        except:
-            dist = 0
-            
-        item['step_distance'] = dist # Thêm thông tin khoảng cách di chuyển
-        result_with_distance.append(item)
-        
-        # Cập nhật điểm trước đó thành điểm hiện tại cho vòng lặp sau
-        prev_loc = current_loc
-        
-    return {"itinerary": result_with_distance}
+def get_itinerary(http_request: Request, response: Response, origin_lat: float = None, origin_lon: float = None):
+    """Itinerary sorted by start time, with the route leg leading to each item.
+
+    Legs are cached per item; only legs whose endpoints changed are routed again.
+    ``origin_lat``/``origin_lon`` only change the first leg of this response, nothing is saved.
+    Clients sending the last ``ETag`` in ``If-None-Match`` get ``304`` while nothing changed;
+    responses with straight-line fallback legs carry no ``ETag``, so they are fetched again.
+    """
+    origin = (origin_lat, origin_lon) if origin_lat is not None and origin_lon is not None else None
+    # Lấy ETag TRƯỚC khi đọc dữ liệu: nếu có thay đổi xen giữa thì ETag cũ hơn dữ liệu,
+    # lần sau client chỉ tải lại thừa 1 lần chứ không bao giờ nhận 304 sai
+    etag = itinerary_etag(origin)
+    if etag_matches(http_request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    sync_legs()
+    data = itinerary_with_legs(origin)
+    # Còn leg fallback (OSRM đang lỗi) thì không gửi ETag: client tải lại lần sau và nhận leg đã route lại
+    if not any(is_fallback_leg(leg) for leg in data["legs"]):
+        response.headers["ETag"] = etag
+    return data
+
+@app.get("/api/itinerary/events")
+async def itinerary_events(http_request: Request):
+    """Server-Sent Events: one ``itinerary`` event whenever the itinerary changes.
+
+    The version lives in the shared store, so changes made through any worker are seen.
+    """
+    async def stream():
+        last_state, idle = None, 0.0
+        while not await http_request.is_disconnected():
+            # Đọc SQLite (có lock của store, có thể chờ busy_timeout) trong threadpool, không chặn event loop
+            state = await run_in_threadpool(itinerary_state)
+            if state != last_state:
+                yield f"event: itinerary\nid: {state['version']}\ndata: {json.dumps(state)}\n\n"
+                last_state, idle = state, 0.0
+            elif idle >= EVENTS_HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            # Giữa các lần kiểm tra không giữ thread nào: chỉ mượn threadpool lúc đọc version
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+            idle += EVENTS_POLL_SECONDS
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/api/itinerary")
 def add_item(item: ItineraryItem):
     """Add an itinerary item with conflict detection."""
-    # Check for time conflicts with existing items
-    if current_itinerary:
-        # Parse time strings for comparison
-        new_start = item.start_time
-        new_end = item.end_time
+    with store.transaction():
+        # Check for time conflicts with existing items
+        existing_item = find_conflict(store.list_itinerary(), item.start_time, item.end_time)
+        if existing_item:
+            return {"status": "error", "message": _conflict_message(existing_item)}
         
-        for existing_item in current_itinerary:
-            existing_start = existing_item.get('start_time')
-            existing_end = existing_item.get('end_time')
-            
-            # Check if new activity overlaps with existing one
-            # Overlap occurs if: new_start < existing_end AND new_end > existing_start
-            if new_start < existing_end and new_end > existing_start:
-                return {
-                    "status": "error", 
-                    "message": f"Xung đột thời gian! Hoạt động '{existing_item.get('name')}' chạy từ {existing_start} đến {existing_end}."
-                }
-    
-    # No conflict, add the item
-    item_dict = item.dict()
-    current_itinerary.append(item_dict)
-    return {"status": "success", "message": "Đã thêm hoạt động vào lịch trình!"}
+        # No conflict, add the item
+        item_id = store.add_itinerary_item(item.dict())
+    return {
+        "status": "success",
+        "message": "Đã thêm hoạt động vào lịch trình!",
+        "item": {**item.dict(), "id": item_id},
+        "delta": sync_legs(),
+    }
+
+@app.put("/api/itinerary/{item_id}")
+def update_item(item_id: int, item: ItineraryItem):
+    """Replace an itinerary item (conflict check ignores the item itself)."""
+    with store.transaction():
+        existing_item = find_conflict(store.list_itinerary(), item.start_time, item.end_time, exclude_id=item_id)
+        if existing_item:
+            return {"status": "error", "message": _conflict_message(existing_item)}
+        if not store.update_itinerary_item(item_id, item.dict()):
+            return {"status": "error", "message": f"Không tìm thấy hoạt động #{item_id}."}
+    return {
+        "status": "success",
+        "message": "Đã cập nhật hoạt động!",
+        "item": {**item.dict(), "id": item_id},
+        "delta": sync_legs(),
+    }
+
+@app.delete("/api/itinerary/{item_id}")
+def delete_item(item_id: int):
+    """Remove an itinerary item; only the leg after it is routed again."""
+    if not store.delete_itinerary_item(item_id):
+        return {"status": "error", "message": f"Không tìm thấy hoạt động #{item_id}."}
+    return {"status": "success", "message": "Đã xóa hoạt động khỏi lịch trình!", "delta": sync_legs()}
+
+
+class BulkItineraryRequest(BaseModel):
+    items: list[ItineraryItem]
+    mode: str = "atomic"  # "atomic" (tất cả hoặc không) | "best_effort"
+
+@app.post("/api/itinerary/bulk")
+def bulk_add_items(request: BulkItineraryRequest):
+    """Import many itinerary items at once; conflicts found in one sort-and-sweep pass."""
+    new_items = [item.dict() for item in request.items]
+    with store.transaction():
+        plan = plan_bulk_import(store.list_itinerary(), new_items, best_effort=request.mode == "best_effort")
+        accepted = [new_items[i] for i in plan["accepted"]]
+        item_ids = store.add_itinerary_items(accepted)
+
+    rejected = [{"index": i, "item": new_items[i], "reason": reason} for i, reason in sorted(plan["rejected"].items())]
+    if not accepted:
+        status = "error" if new_items else "success"
+    else:
+        status = "partial" if rejected else "success"
+    return {
+        "status": status,
+        "message": f"Đã thêm {len(accepted)}/{len(new_items)} hoạt động vào lịch trình.",
+        "added": [{**item, "id": item_id} for item, item_id in zip(accepted, item_ids)],
+        "rejected": rejected,
+        "conflicts": plan["conflicts"],
+        "delta": sync_legs() if accepted else {"changed": [], "removed": []},
+    }
+
+@app.get("/api/itinerary/export")
+def export_itinerary(format: str = "json", date: str = None):
+    """Stream the itinerary as JSON or iCalendar (.ics), page by page."""
+    if format == "ics":
+        day = date or datetime.date.today().isoformat()
+        return StreamingResponse(
+            iter_ics(store.iter_itinerary(), day),
+            media_type="text/calendar; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="eat-chill-itinerary.ics"'},
+        )
+    return StreamingResponse(iter_json(store.iter_itinerary()), media_type="application/json")
 
 
 # API Reset lịch trình (cho tiện test)
 @app.post("/api/itinerary/reset")
 def reset_itinerary():
-    current_itinerary.clear()
+    store.clear_itinerary()
     return {"status": "success"}
 
 
@@ -144,7 +395,7 @@ class RouteRequest(BaseModel):
     waypoints: list = []  # List of [lat, lon] pairs
 
 @app.post("/api/route")
-def get_route_api(request: RouteRequest):
+def get_route_api(request: RouteRequest, http_request: Request, response: Response):
     """Get optimized route from OSRM"""
     route_data = get_osrm_route(
         request.start_lat, 
@@ -153,14 +404,14 @@ def get_route_api(request: RouteRequest):
         request.end_lon,
         request.waypoints
     )
-    return route_data
+    return with_etag(http_request, response, route_data)
 
 
 class MultiRouteRequest(BaseModel):
     points: list  # List of [lat, lon] pairs to visit in order
 
 @app.post("/api/route-multi")
-def get_multi_route_api(request: MultiRouteRequest):
+def get_multi_route_api(request: MultiRouteRequest, http_request: Request, response: Response):
     """Get optimized route visiting multiple points"""
     if len(request.points) < 2:
         return {"status": "error", "message": "Need at least 2 points"}
@@ -171,6 +422,36 @@ def get_multi_route_api(request: MultiRouteRequest):
         waypoints = request.points[1:-1] if len(request.points) > 2 else []
         
         route_data = get_osrm_route(start[0], start[1], end[0], end[1], waypoints)
-        return route_data
+        return with_etag(http_request, response, route_data)
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+
+
+@app.get("/api/stats/upstream")
+def upstream_stats_api():
+    """Upstream calls sent vs. saved by request coalescing (per worker process)."""
+    return {"upstream": upstream_flights.stats()}
+
+
+# ========== Profiling (admin) ==========
+
+# Chưa bật profiling / chưa đặt token / sai token: trả 404 như thể không có API này
+_ADMIN_NOT_FOUND = {"status": "error", "message": "Not found"}
+
+@app.get("/api/admin/profiles")
+def list_profiles_api(http_request: Request):
+    """Captured request profiles, newest first (needs ``X-Profile: <EAT_CHILL_PROFILE_TOKEN>``)."""
+    if not admin_token_ok(http_request.headers.get("x-profile", "")):
+        return JSONResponse(_ADMIN_NOT_FOUND, status_code=404)
+    return {"config": profiling_config(), "profiles": profile_store.list()}
+
+
+@app.get("/api/admin/profiles/{profile_id}")
+def download_profile_api(profile_id: str, http_request: Request):
+    """Download one profile in collapsed-stack format (flamegraph.pl / speedscope)."""
+    if not admin_token_ok(http_request.headers.get("x-profile", "")):
+        return JSONResponse(_ADMIN_NOT_FOUND, status_code=404)
+    path = profile_store.path(profile_id)
+    if path is None:
+        return JSONResponse({"status": "error", "message": "Profile not found"}, status_code=404)
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{profile_id}.folded")
\ No newline at end of file
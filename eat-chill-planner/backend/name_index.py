@@ -0,0 +1,143 @@
+# File: backend/name_index.py
+# Chỉ mục tìm theo tên quán (bỏ dấu tiếng Việt + n-gram ký tự, chịu được lỗi gõ)
+#
+# Index được cập nhật dần mỗi khi Overpass trả kết quả về (xem osm_search.py),
+# nên chỉ tìm được các địa điểm backend đã từng thấy. Mỗi worker có index riêng.
+
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+NGRAM_SIZE = 3
+MIN_SCORE = 0.5  # Tỉ lệ n-gram của query phải khớp (0.5 ~ cho phép sai 1 ký tự)
+
+
+def fold_vietnamese(text: str) -> str:
+    """Lowercase and strip Vietnamese diacritics: "Phở Hòa" -> "pho hoa"."""
+    text = (text or "").replace("đ", "d").replace("Đ", "D")
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def _ngrams(folded: str) -> set:
+    grams = set()
+    for word in folded.split():
+        padded = f"${word}$"
+        if len(padded) <= NGRAM_SIZE:
+            grams.add(padded)
+            continue
+        for i in range(len(padded) - NGRAM_SIZE + 1):
+            grams.add(padded[i:i + NGRAM_SIZE])
+    return grams
+
+
+class NameIndex:
+    """Inverted n-gram index over place names and cuisines."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._places = {}    # place_id -> place dict
+        self._folded = {}    # place_id -> folded "name cuisine" text
+        self._grams = {}     # place_id -> set of n-grams
+        self._postings = {}  # n-gram -> set of place_id
+        self._rows = {}      # place_id -> hàng trong self._coords
+        self._coords = np.empty((0, 2))  # (lat, lon) mỗi hàng, để lọc bán kính cả lô bằng NumPy
+
+    def __len__(self):
+        return len(self._places)
+
+    def add_places(self, places: list):
+        """Insert or refresh places (keyed by place_id)."""
+        with self._lock:
+            for place in places:
+                place_id = place.get("place_id")
+                if place_id in (None, ""):
+                    continue
+                tags = place.get("tags", {}) or {}
+                folded = fold_vietnamese(f"{place.get('name', '')} {tags.get('cuisine', '')}".replace(";", " "))
+                grams = _ngrams(folded)
+
+                for gram in self._grams.get(place_id, set()) - grams:
+                    self._postings[gram].discard(place_id)
+                for gram in grams - self._grams.get(place_id, set()):
+                    self._postings.setdefault(gram, set()).add(place_id)
+
+                self._places[place_id] = place
+                self._folded[place_id] = folded
+                self._grams[place_id] = grams
+                self._set_coords(place_id, place)
+
+    def _set_coords(self, place_id, place: dict):
+        row = self._rows.setdefault(place_id, len(self._rows))
+        if row >= len(self._coords):
+            # Tăng gấp đôi sức chứa để thêm dần không phải chép mảng mỗi lần
+            grown = np.full((max(64, 2 * len(self._coords)), 2), np.nan)
+            grown[:len(self._coords)] = self._coords
+            self._coords = grown
+        self._coords[row] = (place.get("lat", np.nan), place.get("lon", np.nan))
+
+    def _match_counts(self, query_grams: set) -> Counter:
+        counts = Counter()
+        for gram in query_grams:
+            counts.update(self._postings.get(gram, ()))
+        return counts
+
+    def _best(self, folded: str, query_grams: set, matches, limit: int) -> list:
+        """Score ``(place_id, common n-grams, tie-break)`` and keep the ``limit`` best place_ids."""
+        scored = []
+        for place_id, common, tie_break in matches:
+            score = common / len(query_grams)
+            if folded in self._folded[place_id]:
+                score += 1.0  # Khớp nguyên cụm được ưu tiên
+            if score >= MIN_SCORE:
+                scored.append((-score, len(self._folded[place_id]), tie_break, len(scored), place_id))
+        return [place_id for *_, place_id in heapq.nsmallest(limit, scored)]
+
+    def search(self, keyword: str, limit: int = 20) -> list:
+        """Return indexed places matching ``keyword``, best match first."""
+        folded = fold_vietnamese(keyword)
+        query_grams = _ngrams(folded)
+        if not query_grams:
+            return []
+
+        with self._lock:
+            counts = self._match_counts(query_grams)
+            matches = ((place_id, common, 0) for place_id, common in counts.items())
+            return [self._places[i] for i in self._best(folded, query_grams, matches, limit)]
+
+    def search_near(self, keyword: str, lat: float, lon: float, radius_km: float, limit: int = 20) -> list:
+        """Like ``search`` but only places within ``radius_km``, with ``distance`` from (lat, lon)."""
+        from backend.osm_search import haversine_matrix_km  # osm_search import module này
+
+        folded = fold_vietnamese(keyword)
+        query_grams = _ngrams(folded)
+        if not query_grams:
+            return []
+
+        with self._lock:
+            counts = self._match_counts(query_grams)
+            if not counts:
+                return []
+            place_ids = list(counts)
+            rows = np.fromiter(map(self._rows.__getitem__, place_ids), dtype=np.intp, count=len(place_ids))
+            lats, lons = self._coords[rows, 0], self._coords[rows, 1]
+
+            # Khung bao quanh bán kính loại nhanh phần lớn ứng viên, chỉ tính khoảng cách cho phần còn lại
+            dlat = radius_km / 111.0
+            dlon = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+            inside = np.flatnonzero((np.abs(lats - lat) <= dlat) & (np.abs(lons - lon) <= dlon))
+            distances = haversine_matrix_km([lat], [lon], lats[inside], lons[inside])[0]
+            near = {place_ids[i]: d for i, d in zip(inside.tolist(), distances.tolist()) if d <= radius_km}
+
+            # Cùng điểm thì quán gần hơn đứng trước
+            best = self._best(folded, query_grams, ((i, counts[i], d) for i, d in near.items()), limit)
+            return [{**self._places[i], "distance": round(near[i], 2)} for i in best]
+
+
+poi_index = NameIndex()
@@ -1,41 +1,229 @@
 # File: backend/osm_search.py
 # OpenStreetMap Search + OSRM Routing Integration
 
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
 from geopy.distance import geodesic
 import requests
 
-OSRM_API = "http://router.project-osrm.org/route/v1/driving"
-OVERPASS_API = "https://overpass-api.de/api/interpreter"
+from backend.name_index import poi_index
+from backend.place_filters import PlaceBatch
+from backend.store import store
+
+# Có thể trỏ sang server khác (vd: server giả lập khi load test) qua biến môi trường
+OSRM_BASE_URL = os.environ.get("EAT_CHILL_OSRM_URL", "http://router.project-osrm.org")
+OSRM_API = f"{OSRM_BASE_URL}/route/v1/driving"
+OSRM_TABLE_API = f"{OSRM_BASE_URL}/table/v1/driving"
+OVERPASS_API = os.environ.get("EAT_CHILL_OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+
+
+OSM_TAG_MAP = {
+    "restaurant": "amenity=restaurant",
+    "cafe": "amenity=cafe",
+    "coffee": "amenity=cafe",
+    "nhà hàng": "amenity=restaurant",
+    "quán": "amenity=restaurant",
+    "cà phê": "amenity=cafe",
+    "ăn": "amenity=restaurant",
+    "giải trí": 'amenity~"^(cinema|theatre|arts_centre|karaoke_box|nightclub)$"',
+}
+
+# Cache kết quả Overpass (dùng chung giữa các worker qua backend.store)
+OVERPASS_CACHE_TTL = 300  # giây
+
+# Cache ma trận thời gian OSRM theo từng cặp tọa độ (làm tròn ~11m)
+OSRM_TABLE_CACHE_TTL = 3600  # giây
+COORD_SNAP_DECIMALS = 4
+OSRM_TABLE_MAX_LOCATIONS = 100  # Giới hạn số tọa độ / request table của server OSRM công khai
+OSRM_TABLE_PARALLEL = 4         # Số request table chạy song song
+_osrm_pool = None
+_osrm_pool_lock = threading.Lock()
+
+# Ước lượng thời gian khi OSRM không trả lời kịp: đường chim bay × hệ số đường vòng / tốc độ nội thành
+FALLBACK_SPEED_KMH = 25.0
+ROAD_DETOUR_FACTOR = 1.3
+
+# Cặp "ăn rồi chill": lọc trước top_k × hệ số này cặp theo đường chim bay, rồi xếp lại theo OSRM
+PAIR_SHORTLIST_FACTOR = 5
+
+# Payload Overpass lớn hơn ngưỡng này sẽ được parse trong process pool
+# (EAT_CHILL_CPU_WORKERS = số process, 0 = parse ngay trên thread của request)
+CPU_WORKERS = int(os.environ.get("EAT_CHILL_CPU_WORKERS", "0"))
+PROCESS_POOL_MIN_BYTES = 256 * 1024
+_cpu_pool = None
+_cpu_pool_lock = threading.Lock()
+
+
+def resolve_osm_tag(query: str) -> str:
+    """Map a free-text query to an Overpass tag selector (default: restaurants)."""
+    query_lower = (query or "").lower().strip()
+    for key, tag in OSM_TAG_MAP.items():
+        if key in query_lower:
+            return tag
+    return "amenity=restaurant"
+
+
+def _bbox_str(lat: float, lon: float, radius_km: float) -> str:
+    radius_deg = radius_km / 111.0
+    return f"{lat - radius_deg},{lon - radius_deg},{lat + radius_deg},{lon + radius_deg}"
+
+
+def _fetch_overpass(overpass_query: str):
+    """POST a query to Overpass, returning the raw JSON text or None on failure."""
+    cache_key = hashlib.sha1(overpass_query.encode("utf-8")).hexdigest()
+    cached = store.cache_get("overpass", cache_key)
+    if cached is not None:
+        return cached
+
+    response = requests.post(OVERPASS_API, data=overpass_query, timeout=10)
+    if response.status_code != 200:
+        return None
+
+    store.cache_set("overpass", cache_key, response.text, OVERPASS_CACHE_TTL)
+    return response.text
+
+
+def _run_cpu_bound(func, payload: str, *args):
+    """Run ``func(payload, *args)`` in the process pool when the payload is big enough."""
+    global _cpu_pool
+    if CPU_WORKERS <= 0 or len(payload) < PROCESS_POOL_MIN_BYTES:
+        return func(payload, *args)
+    with _cpu_pool_lock:
+        if _cpu_pool is None:
+            _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS)
+    return _cpu_pool.submit(func, payload, *args).result()
+
+
+class SingleFlight:
+    """Coalesce concurrent identical upstream calls: one caller fetches, the rest wait for its result."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def do(self, kind: str, key, func):
+        with self._lock:
+            stats = self._stats.setdefault(kind, {"upstream_calls": 0, "coalesced": 0})
+            call = self._calls.get((kind, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(kind, key)] = self._Call()
+                stats["upstream_calls"] += 1
+            else:
+                stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[(kind, key)]
+            call.done.set()
+
+    def stats(self) -> dict:
+        """Per upstream kind: calls actually sent and calls saved by coalescing."""
+        with self._lock:
+            return {kind: dict(stats) for kind, stats in self._stats.items()}
+
+
+upstream_flights = SingleFlight()
+
+
+def _element_to_place(element: dict, user_loc: tuple, radius_km: float):
+    """Convert an Overpass element to a place dict, or None if unusable/out of range."""
+    if 'center' in element:
+        el_lat = element['center']['lat']
+        el_lon = element['center']['lon']
+    elif 'lat' in element:
+        el_lat = element['lat']
+        el_lon = element['lon']
+    else:
+        return None
+
+    name = element.get('tags', {}).get('name', 'Unnamed')
+    place_loc = (el_lat, el_lon)
+    distance = geodesic(user_loc, place_loc).km
+
+    if distance > radius_km:
+        return None
+
+    rating = None
+    if 'tags' in element:
+        rating_str = element['tags'].get('rating')
+        if rating_str:
+            try:
+                rating = float(rating_str)
+            except:
+                rating = None
+
+    # Include all OSM tags for filtering later
+    tags = element.get('tags', {})
+
+    return {
+        "name": name,
+        "address": tags.get('addr:full', name),
+        "lat": el_lat,
+        "lon": el_lon,
+        "distance": round(distance, 2),
+        "rating": rating,
+        "place_id": element.get('id', ''),
+        "source": "OpenStreetMap (Overpass)",
+        "tags": tags  # Include full OSM tags
+    }
+
+
+def parse_overpass_places(payload: str, lat: float, lon: float, radius_km: float, limit: int) -> list:
+    """Parse an Overpass JSON payload into places sorted by distance (picklable for the pool)."""
+    data = json.loads(payload)
+    results = []
+    user_loc = (lat, lon)
+    
+    for element in data.get('elements', [])[:limit*2]:
+        try:
+            place = _element_to_place(element, user_loc, radius_km)
+            if place is None:
+                continue
+            
+            results.append(place)
+            
+            if len(results) >= limit:
+                break
+                
+        except:
+            continue
+    
+    results.sort(key=lambda x: x['distance'])
+    return results
 
 
 def search_osm_overpass(query: str, lat: float, lon: float, radius_km: float = 5, limit: int = 10):
     """Search for POIs using Overpass API"""
     try:
-        # Map keywords to OSM tags
-        osm_tag_map = {
-            "restaurant": "amenity=restaurant",
-            "cafe": "amenity=cafe",
-            "coffee": "amenity=cafe",
-            "nhà hàng": "amenity=restaurant",
-            "quán": "amenity=restaurant",
-            "cà phê": "amenity=cafe",
-            "ăn": "amenity=restaurant",
-        }
-        
-        # Find matching tag
-        osm_tag = None
-        query_lower = query.lower().strip()
-        for key, tag in osm_tag_map.items():
-            if key in query_lower:
-                osm_tag = tag
-                break
-        
-        if not osm_tag:
-            osm_tag = "amenity=restaurant"
-        
-        # Calculate bounding box
-        radius_deg = radius_km / 111.0
-        bbox_str = f"{lat - radius_deg},{lon - radius_deg},{lat + radius_deg},{lon + radius_deg}"
+        osm_tag = resolve_osm_tag(query)
+        bbox_str = _bbox_str(lat, lon, radius_km)
         
         # Overpass query
         overpass_query = f"""
@@ -48,70 +236,148 @@ def search_osm_overpass(query: str, lat: float, lon: float, radius_km: float = 5
         out center;
         """
         
-        response = requests.post(OVERPASS_API, data=overpass_query, timeout=10)
+        def fetch_and_parse():
+            payload = _fetch_overpass(overpass_query)
+            if payload is None:
+                return []
+            results = _run_cpu_bound(parse_overpass_places, payload, lat, lon, radius_km, limit)
+            poi_index.add_places(results)
+            # Cột lọc (place_filters) dựng 1 lần cho cả lô, các request dùng chung kết quả này dùng lại
+            return PlaceBatch(results)
         
-        if response.status_code != 200:
-            return []
+        # Các request giống hệt nhau đang chạy cùng lúc chỉ gọi Overpass 1 lần
+        results = upstream_flights.do("overpass", (osm_tag, bbox_str, limit), fetch_and_parse)
+        return results.copy() if isinstance(results, PlaceBatch) else list(results)
         
-        data = response.json()
-        results = []
-        user_loc = (lat, lon)
-        
-        for element in data.get('elements', [])[:limit*2]:
-            try:
-                if 'center' in element:
-                    el_lat = element['center']['lat']
-                    el_lon = element['center']['lon']
-                elif 'lat' in element:
-                    el_lat = element['lat']
-                    el_lon = element['lon']
-                else:
-                    continue
-                
-                name = element.get('tags', {}).get('name', 'Unnamed')
-                place_loc = (el_lat, el_lon)
-                distance = geodesic(user_loc, place_loc).km
-                
-                if distance > radius_km:
-                    continue
-                
-                rating = None
-                if 'tags' in element:
-                    rating_str = element['tags'].get('rating')
-                    if rating_str:
-                        try:
-                            rating = float(rating_str)
-                        except:
-                            rating = None
-                
-                # Include all OSM tags for filtering later
-                tags = element.get('tags', {})
-                
-                results.append({
-                    "name": name,
-                    "address": tags.get('addr:full', name),
-                    "lat": el_lat,
-                    "lon": el_lon,
-                    "distance": round(distance, 2),
-                    "rating": rating,
-                    "place_id": element.get('id', ''),
-                    "source": "OpenStreetMap (Overpass)",
-                    "tags": tags  # Include full OSM tags
-                })
-                
-                if len(results) >= limit:
-                    break
-                    
-            except:
+    except Exception as e:
+        print(f"Overpass Error: {e}")
+        return []
+
+
+def _tag_matches(osm_tag: str, tags: dict) -> bool:
+    """Evaluate a simple Overpass tag selector (key=value or key~"regex") locally."""
+    if "~" in osm_tag:
+        key, pattern = osm_tag.split("~", 1)
+        return re.search(pattern.strip('"'), tags.get(key, "")) is not None
+    key, value = osm_tag.split("=", 1)
+    return tags.get(key) == value
+
+
+def parse_overpass_groups(payload: str, groups: dict, lat: float, lon: float, radius_km: float, limit: int) -> dict:
+    """Split a union Overpass payload into per-group place lists (picklable for the pool)."""
+    data = json.loads(payload)
+    results = {group: [] for group in groups}
+    user_loc = (lat, lon)
+    for element in data.get('elements', []):
+        try:
+            tags = element.get('tags', {})
+            matched = [g for g, osm_tag in groups.items() if _tag_matches(osm_tag, tags)]
+            if not matched:
                 continue
-        
-        results.sort(key=lambda x: x['distance'])
-        return results
-        
+            place = _element_to_place(element, user_loc, radius_km)
+            if place is None:
+                continue
+            for group in matched:
+                results[group].append(place)
+        except:
+            continue
+
+    for group in results:
+        results[group].sort(key=lambda x: x['distance'])
+        results[group] = results[group][:limit]
+    return results
+
+
+def search_osm_overpass_multi(queries: dict, lat: float, lon: float, radius_km: float = 5, limit: int = 100):
+    """Search several tag groups with ONE union Overpass query.
+
+    ``queries`` maps a group name to a free-text query (e.g. ``{"food": "Ăn uống",
+    "chill": "Giải trí"}``). Returns ``{group: [places...]}``, each list sorted by
+    distance and capped at ``limit``.
+    """
+    groups = {group: resolve_osm_tag(q) for group, q in queries.items()}
+    try:
+        bbox_str = _bbox_str(lat, lon, radius_km)
+        selectors = ""
+        for osm_tag in dict.fromkeys(groups.values()):
+            selectors += f"""
+          node[{osm_tag}]({bbox_str});
+          way[{osm_tag}]({bbox_str});
+          relation[{osm_tag}]({bbox_str});"""
+        overpass_query = f"""
+        [out:json];
+        ({selectors}
+        );
+        out center;
+        """
+
+        def fetch_and_parse():
+            payload = _fetch_overpass(overpass_query)
+            if payload is None:
+                return {group: [] for group in groups}
+            results = _run_cpu_bound(parse_overpass_groups, payload, groups, lat, lon, radius_km, limit)
+            for places in results.values():
+                poi_index.add_places(places)
+            return {group: PlaceBatch(places) for group, places in results.items()}
+
+        key = (tuple(sorted(groups.items())), bbox_str, limit)
+        results = upstream_flights.do("overpass", key, fetch_and_parse)
+        return {group: places.copy() for group, places in results.items()}
+
     except Exception as e:
         print(f"Overpass Error: {e}")
+        return {group: [] for group in groups}
+
+
+def haversine_matrix_km(lats_a, lons_a, lats_b, lons_b):
+    """Great-circle distance matrix (km) between two point sets, shape (len(a), len(b))."""
+    lat1 = np.radians(np.asarray(lats_a, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(lons_a, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats_b, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(lons_b, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def rank_place_pairs(first: list, second: list, origin: tuple, top_k: int = 10):
+    """Rank (first, second) place pairs by origin→first + first→second distance.
+
+    Scoring is vectorized over the full len(first) × len(second) matrix.
+    """
+    if not first or not second:
         return []
 
+    first_lats = [p["lat"] for p in first]
+    first_lons = [p["lon"] for p in first]
+    leg1 = haversine_matrix_km([origin[0]], [origin[1]], first_lats, first_lons)[0]
+    leg2 = haversine_matrix_km(first_lats, first_lons,
+                               [p["lat"] for p in second], [p["lon"] for p in second])
+    total = leg1[:, None] + leg2
+
+    # Exclude pairing a place with itself (possible if it matches both groups)
+    first_ids = np.array([str(p.get("place_id")) for p in first])[:, None]
+    second_ids = np.array([str(p.get("place_id")) for p in second])[None, :]
+    total = np.where(first_ids == second_ids, np.inf, total)
+
+    k = min(top_k, total.size)
+    flat = total.ravel()
+    best = np.argpartition(flat, k - 1)[:k]
+    best = best[np.argsort(flat[best], kind="stable")]
+
+    pairs = []
+    for idx in best:
+        if not np.isfinite(flat[idx]):
+            break
+        i, j = divmod(int(idx), total.shape[1])
+        pairs.append({
+            "first": first[i],
+            "second": second[j],
+            "first_distance_km": round(float(leg1[i]), 2),
+            "hop_distance_km": round(float(leg2[i, j]), 2),
+            "total_distance_km": round(float(total[i, j]), 2),
+        })
+    return pairs
+
 
 def search_osm(query: str, lat: float, lon: float, radius_km: float = 5, limit: int = 10):
     """Search for places on OpenStreetMap"""
@@ -256,6 +522,17 @@ def matches_entertainment_filters(place_tags: dict, filters: dict) -> bool:
 def get_osrm_route(start_lat: float, start_lon: float, 
                    end_lat: float, end_lon: float,
                    waypoints: list = None):
+    """Get routing coordinates from OSRM (identical concurrent requests share one call)"""
+    key = (start_lat, start_lon, end_lat, end_lon, tuple(tuple(wp) for wp in waypoints or []))
+    return upstream_flights.do(
+        "osrm_route", key,
+        lambda: _fetch_osrm_route(start_lat, start_lon, end_lat, end_lon, waypoints)
+    )
+
+
+def _fetch_osrm_route(start_lat: float, start_lon: float, 
+                      end_lat: float, end_lon: float,
+                      waypoints: list = None):
     """Get routing coordinates from OSRM"""
     try:
         coords = f"{start_lon},{start_lat}"
@@ -304,3 +581,215 @@ def get_osrm_route(start_lat: float, start_lon: float,
             "duration_seconds": 0,
             "source": "fallback"
         }
+
+
+def _snap(point) -> tuple:
+    return (round(float(point[0]), COORD_SNAP_DECIMALS), round(float(point[1]), COORD_SNAP_DECIMALS))
+
+
+def get_osrm_table(sources: list, destinations: list, budget_seconds: float = None) -> list:
+    """Driving durations in seconds from each source to each destination ([lat, lon] pairs).
+
+    Pairs that are not cached yet are fetched with as few OSRM table requests as the
+    server's size limit allows, run in parallel. Returns a len(sources) × len(destinations)
+    nested list with None where no route was found, or where the chunk did not answer
+    within ``budget_seconds`` (late chunks still fill the cache for the next call).
+    """
+    sources = [_snap(p) for p in sources]
+    destinations = [_snap(p) for p in destinations]
+    durations = [[None] * len(destinations) for _ in sources]
+
+    keys = {(src, dst): f"{src}|{dst}" for src in sources for dst in destinations}
+    cached = store.cache_get_many("osrm_table", list(keys.values()))
+    missing_src, missing_dst = set(), set()
+    for i, src in enumerate(sources):
+        for j, dst in enumerate(destinations):
+            hit = cached.get(keys[(src, dst)])
+            if hit is not None:
+                durations[i][j] = hit["duration"]
+            else:
+                missing_src.add(src)
+                missing_dst.add(dst)
+    if not missing_src:
+        return durations
+
+    src_list = sorted(missing_src)
+    dst_list = sorted(missing_dst)
+    # Mỗi request OSRM tối đa OSRM_TABLE_MAX_LOCATIONS tọa độ -> chia nhỏ nguồn/đích
+    src_step = max(1, min(len(src_list), OSRM_TABLE_MAX_LOCATIONS // 2))
+    chunks = []
+    for s0 in range(0, len(src_list), src_step):
+        src_chunk = src_list[s0:s0 + src_step]
+        dst_step = OSRM_TABLE_MAX_LOCATIONS - len(src_chunk)
+        for d0 in range(0, len(dst_list), dst_step):
+            chunks.append((src_chunk, dst_list[d0:d0 + dst_step]))
+
+    found = {}
+    futures = [_osrm_table_pool().submit(_fetch_table_chunk, src_chunk, dst_chunk)
+               for src_chunk, dst_chunk in chunks]
+    done, not_done = wait(futures, timeout=budget_seconds)
+    if not_done:
+        print(f"OSRM Table: {len(not_done)}/{len(futures)} chunk(s) over budget, answered without them")
+    for future in done:
+        try:
+            found.update(future.result())
+        except Exception as e:
+            print(f"OSRM Table Error: {e}")
+
+    for i, src in enumerate(sources):
+        for j, dst in enumerate(destinations):
+            if durations[i][j] is None:
+                durations[i][j] = found.get((src, dst))
+    return durations
+
+
+def _osrm_table_pool() -> ThreadPoolExecutor:
+    global _osrm_pool
+    with _osrm_pool_lock:
+        if _osrm_pool is None:
+            _osrm_pool = ThreadPoolExecutor(max_workers=OSRM_TABLE_PARALLEL, thread_name_prefix="osrm-table")
+        return _osrm_pool
+
+
+def _fetch_table_chunk(src_list: list, dst_list: list) -> dict:
+    """One OSRM table request; caches and returns {(src, dst): seconds} for routable pairs."""
+    coords = ";".join(f"{p[1]},{p[0]}" for p in src_list + dst_list)
+    params = {
+        "sources": ";".join(str(i) for i in range(len(src_list))),
+        "destinations": ";".join(str(len(src_list) + i) for i in range(len(dst_list))),
+        "annotations": "duration",
+    }
+    key = (coords, params["sources"], params["destinations"])
+    matrix = upstream_flights.do("osrm_table", key, lambda: _fetch_osrm_table(coords, params))
+    if matrix is None:
+        return {}
+
+    found = {}
+    for i, src in enumerate(src_list):
+        for j, dst in enumerate(dst_list):
+            if matrix[i][j] is not None:
+                found[(src, dst)] = matrix[i][j]
+    store.cache_set_many("osrm_table", {f"{src}|{dst}": {"duration": v} for (src, dst), v in found.items()},
+                         OSRM_TABLE_CACHE_TTL)
+    return found
+
+
+def _fetch_osrm_table(coords: str, params: dict):
+    response = requests.get(f"{OSRM_TABLE_API}/{coords}", params=params, timeout=10)
+    data = response.json()
+    if data.get('code') != 'Ok':
+        return None
+    return data.get('durations', [])
+
+
+def travel_time_matrix(origins: list, places: list, budget_seconds: float = None):
+    """Seconds from every origin to every place as arrays of shape (len(origins), len(places)).
+
+    Returns ``(seconds, estimated)``. Pairs OSRM did not answer (no route, error or
+    over budget) are estimated from straight-line distance at FALLBACK_SPEED_KMH
+    and flagged in ``estimated``.
+    """
+    table = get_osrm_table(origins, [(p["lat"], p["lon"]) for p in places], budget_seconds)
+    seconds = np.array([[np.nan if v is None else v for v in row] for row in table], dtype=float)
+    seconds = seconds.reshape(len(origins), len(places))
+    estimated = np.isnan(seconds)
+    if estimated.any():
+        km = haversine_matrix_km([o[0] for o in origins], [o[1] for o in origins],
+                                 [p["lat"] for p in places], [p["lon"] for p in places])
+        seconds = np.where(estimated, km * ROAD_DETOUR_FACTOR / FALLBACK_SPEED_KMH * 3600, seconds)
+    return seconds, estimated
+
+
+def rank_places_by_duration(places: list, origin: tuple) -> list:
+    """Attach ``duration_minutes`` (OSRM driving time from origin) and sort by it.
+
+    Places OSRM could not route keep their distance order after the routed ones.
+    """
+    if not places:
+        return []
+    row = get_osrm_table([origin], [(p["lat"], p["lon"]) for p in places])[0]
+    ranked = []
+    for place, seconds in zip(places, row):
+        ranked.append({**place, "duration_minutes": round(seconds / 60, 1) if seconds is not None else None})
+    ranked.sort(key=lambda p: (p["duration_minutes"] is None, p["duration_minutes"] or 0, p["distance"]))
+    return ranked
+
+
+def group_search_area(origins: list, radius_km: float) -> tuple:
+    """Centroid of the origins and a radius around it that reaches every origin plus ``radius_km``."""
+    lats = [o[0] for o in origins]
+    lons = [o[1] for o in origins]
+    centroid = (sum(lats) / len(lats), sum(lons) / len(lons))
+    spread = haversine_matrix_km([centroid[0]], [centroid[1]], lats, lons).max()
+    return centroid, float(spread) + radius_km
+
+
+def rank_places_for_group(places: list, origins: list, objective: str = "minimax",
+                          top_k: int = 20, budget_seconds: float = None) -> list:
+    """Rank meetup places by travel time from every origin (one OSRM table, origins × places).
+
+    ``objective="minimax"`` minimizes the longest trip (fairest), ``"total"`` the sum of
+    all trips. Each place gets ``travel_minutes`` (per origin), ``max_minutes``,
+    ``total_minutes`` and ``estimated`` (some times are straight-line estimates).
+    """
+    if not places or not origins:
+        return []
+    seconds, estimated = travel_time_matrix(origins, places, budget_seconds)
+    worst = seconds.max(axis=0)
+    total = seconds.sum(axis=0)
+    # Sắp theo mục tiêu chính, hòa thì xét mục tiêu còn lại
+    order = np.lexsort((worst, total) if objective == "total" else (total, worst))[:top_k]
+
+    ranked = []
+    for j in order:
+        ranked.append({
+            **places[j],
+            "travel_minutes": [round(float(v) / 60, 1) for v in seconds[:, j]],
+            "max_minutes": round(float(worst[j]) / 60, 1),
+            "total_minutes": round(float(total[j]) / 60, 1),
+            "estimated": bool(estimated[:, j].any()),
+        })
+    return ranked
+
+
+def rank_place_pairs_by_travel_time(first: list, second: list, origin: tuple, top_k: int = 10,
+                                    budget_seconds: float = None) -> list:
+    """Rank (first, second) place pairs by driving time origin→first + first→second.
+
+    The straight-line ranking shortlists ``top_k × PAIR_SHORTLIST_FACTOR`` pairs, which
+    are re-ranked with two OSRM tables (origin → first places, first → second places).
+    Legs OSRM does not answer within ``budget_seconds`` are straight-line estimates and
+    the pair is flagged ``estimated``.
+    """
+    shortlist = rank_place_pairs(first, second, origin, top_k * PAIR_SHORTLIST_FACTOR)
+    if not shortlist:
+        return []
+    started = time.monotonic()
+
+    # Mỗi quán chỉ hỏi OSRM một lần dù nằm trong nhiều cặp
+    first_places = {id(pair["first"]): pair["first"] for pair in shortlist}
+    second_places = {id(pair["second"]): pair["second"] for pair in shortlist}
+    first_index = {key: i for i, key in enumerate(first_places)}
+    second_index = {key: j for j, key in enumerate(second_places)}
+
+    leg1, leg1_estimated = travel_time_matrix([origin], list(first_places.values()), budget_seconds)
+    remaining = None if budget_seconds is None else max(0.0, budget_seconds - (time.monotonic() - started))
+    leg2, leg2_estimated = travel_time_matrix([(p["lat"], p["lon"]) for p in first_places.values()],
+                                              list(second_places.values()), remaining)
+
+    ranked = []
+    for pair in shortlist:
+        i = first_index[id(pair["first"])]
+        j = second_index[id(pair["second"])]
+        first_seconds = float(leg1[0, i])
+        hop_seconds = float(leg2[i, j])
+        ranked.append((first_seconds + hop_seconds, {
+            **pair,
+            "first_minutes": round(first_seconds / 60, 1),
+            "hop_minutes": round(hop_seconds / 60, 1),
+            "total_minutes": round((first_seconds + hop_seconds) / 60, 1),
+            "estimated": bool(leg1_estimated[0, i] or leg2_estimated[i, j]),
+        }))
+    # Hòa thời gian thì giữ thứ tự theo khoảng cách (sort ổn định)
+    ranked.sort(key=lambda item: item[0])
+    return [pair for _, pair in ranked[:top_k]]
@@ -0,0 +1,329 @@
+# File: backend/place_filters.py
+# Lọc + chấm điểm cả lô địa điểm bằng NumPy (dạng cột) thay vì gọi matches_*_filters từng quán
+#
+# Kết quả lọc phải GIỐNG HỆT matches_food_filters / matches_entertainment_filters
+# trong osm_search.py (kiểm tra bằng scripts/check_filter_pipeline.py).
+# Sửa luật lọc ở đó thì phải sửa cả ở đây.
+
+import re
+import unicodedata
+from functools import cached_property
+from operator import methodcaller
+
+import numpy as np
+
+from backend.name_index import fold_vietnamese
+
+# Trọng số điểm liên quan (relevance)
+SCORE_WEIGHTS = {"proximity": 0.5, "keyword": 0.3, "rating": 0.1, "preference": 0.1}
+
+_COMBINING_MARKS = re.compile("[\u0300-\u036f]")
+_NON_ALNUM = re.compile("[^a-z0-9\0]+")
+
+
+def _categorical(values: list):
+    """Encode strings as (list of distinct values, code per row)."""
+    lookup = {v: code for code, v in enumerate(dict.fromkeys(values))}
+    codes = np.fromiter(map(lookup.__getitem__, values), dtype=np.intp, count=len(values))
+    return list(lookup), codes
+
+
+def _blob(texts: list):
+    """Join texts with \\0 into one string + start offset of each row.
+
+    Tìm chuỗi con trên cả lô chỉ cần 1 lần quét regex thay vì 1 lần ``in`` cho mỗi quán.
+    """
+    offsets = np.zeros(len(texts), dtype=np.intp)
+    if len(texts) > 1:
+        offsets[1:] = np.cumsum(np.fromiter(map(len, texts[:-1]), dtype=np.intp, count=len(texts) - 1) + 1)
+    return "\0".join(texts), offsets
+
+
+class PlaceColumns:
+    """A batch of places as parallel NumPy columns (one row per place).
+
+    Columns are built on first use, so a request that only filters by price never
+    touches names or cuisines.
+    """
+
+    # Cột chép được sang tập con bằng cách lấy hàng (các blob chuỗi thì dựng lại khi cần)
+    _ROW_COLUMNS = ("distance", "rating", "outdoor")
+
+    def __init__(self, places: list):
+        self.places = places
+        self.size = len(places)
+        self._tags = [place.get("tags", {}) or {} for place in places]
+
+    def take(self, rows: np.ndarray) -> "PlaceColumns":
+        """Columns of the rows ``rows`` (in that order), reusing every column built so far."""
+        sub = PlaceColumns.__new__(PlaceColumns)
+        sub.places = [self.places[i] for i in rows]
+        sub.size = len(sub.places)
+        sub._tags = [self._tags[i] for i in rows]
+        built = self.__dict__
+        for name in self._ROW_COLUMNS:
+            if name in built:
+                sub.__dict__[name] = built[name][rows]
+        if "_price" in built:
+            sub.__dict__["_price"] = tuple(column[rows] for column in built["_price"])
+        for name in ("_amenity", "_cuisine"):
+            if name in built:
+                values, codes = built[name]
+                sub.__dict__[name] = (values, codes[rows])
+        return sub
+
+    def _tag_column(self, key: str, default: str = '') -> list:
+        """Lowercased tag values, extracted with C-level map (no Python loop body per row)."""
+        return list(map(str.lower, map(methodcaller('get', key, default), self._tags)))
+
+    @cached_property
+    def distance(self) -> np.ndarray:
+        return np.fromiter((p.get("distance") or 0.0 for p in self.places), dtype=float, count=self.size)
+
+    @cached_property
+    def rating(self) -> np.ndarray:
+        return np.fromiter((np.nan if p.get("rating") is None else p["rating"] for p in self.places),
+                           dtype=float, count=self.size)
+
+    @cached_property
+    def _name_blob(self):
+        return _blob(self._tag_column('name'))
+
+    @cached_property
+    def _amenity(self):
+        return _categorical(self._tag_column('amenity'))
+
+    @cached_property
+    def _cuisine(self):
+        return _categorical(self._tag_column('cuisine'))
+
+    @cached_property
+    def outdoor(self) -> np.ndarray:
+        return np.array(self._tag_column('outdoor_seating', 'no'), dtype=object) == 'yes'
+
+    @cached_property
+    def _price(self):
+        prices = self._tag_column('price')
+        has_price = np.fromiter(map(bool, prices), dtype=bool, count=self.size)
+        dollars = np.fromiter(map(methodcaller('count', '$'), prices), dtype=np.intp, count=self.size)
+        return has_price, dollars
+
+    @property
+    def has_price(self) -> np.ndarray:
+        return self._price[0]
+
+    @property
+    def dollars(self) -> np.ndarray:
+        return self._price[1]
+
+    @cached_property
+    def _folded_blob(self):
+        """Folded "name cuisine" of every row (only built when scoring by keyword)."""
+        texts = [f"{p.get('name', '')} {(p.get('tags') or {}).get('cuisine', '')}" for p in self.places]
+        # Bỏ dấu cả lô 1 lần (giống fold_vietnamese nhưng giữ lại dấu phân cách \0 giữa các quán)
+        blob = unicodedata.normalize("NFD", "\0".join(texts).replace("đ", "d").replace("Đ", "D"))
+        blob = _NON_ALNUM.sub(" ", _COMBINING_MARKS.sub("", blob).lower())
+        offsets = np.array([0] + [m.end() for m in re.finditer("\0", blob)], dtype=np.intp)
+        return blob, offsets[:self.size]
+
+    def none(self) -> np.ndarray:
+        return np.zeros(self.size, dtype=bool)
+
+    def name_contains(self, *needles) -> np.ndarray:
+        return self._rows_matching(self._name_blob, "|".join(re.escape(n) for n in needles))
+
+    def folded_contains(self, folded_keyword: str) -> np.ndarray:
+        return self._rows_matching(self._folded_blob, re.escape(folded_keyword))
+
+    def _rows_matching(self, blob_and_offsets, pattern: str) -> np.ndarray:
+        blob, offsets = blob_and_offsets
+        starts = np.array([m.start() for m in re.finditer(pattern, blob)], dtype=np.intp)
+        mask = self.none()
+        mask[np.searchsorted(offsets, starts, side="right") - 1] = True
+        return mask
+
+    def _category_mask(self, column, test) -> np.ndarray:
+        # Chỉ kiểm tra trên danh sách giá trị khác nhau (ít hơn nhiều so với số quán)
+        values, codes = column
+        hits = np.fromiter((test(v) for v in values), dtype=bool, count=len(values))
+        return hits[codes]
+
+    def amenity_in(self, *values) -> np.ndarray:
+        return self._category_mask(self._amenity, lambda v: v in values)
+
+    def amenity_contains(self, *needles) -> np.ndarray:
+        return self._category_mask(self._amenity, lambda v: any(n in v for n in needles))
+
+    def cuisine_contains(self, *needles) -> np.ndarray:
+        return self._category_mask(self._cuisine, lambda v: any(n in v for n in needles))
+
+
+class PlaceBatch(list):
+    """A list of places carrying its :class:`PlaceColumns`.
+
+    Overpass results are returned as a batch, so every request filtering or ranking
+    the same results (coalesced requests, filter then relevance) builds each column
+    once. Slicing or copying with ``list()`` gives a plain list without columns.
+    """
+
+    def __init__(self, places=(), columns: PlaceColumns = None):
+        super().__init__(places)
+        self.columns = columns if columns is not None else PlaceColumns(self)
+
+    def copy(self) -> "PlaceBatch":
+        """New list object sharing the same columns (do not reorder it in place)."""
+        return PlaceBatch(self, self.columns)
+
+
+def columns_of(places: list) -> PlaceColumns:
+    """The batch's own columns if ``places`` is an unchanged PlaceBatch, else new ones."""
+    if isinstance(places, PlaceBatch) and places.columns.size == len(places):
+        return places.columns
+    return PlaceColumns(places)
+
+
+def _any_of(clauses: list):
+    """Row matches if any clause matches (no clause -> nothing matches)."""
+    def predicate(cols: PlaceColumns) -> np.ndarray:
+        mask = cols.none()
+        for clause in clauses:
+            mask |= clause(cols)
+        return mask
+    return predicate
+
+
+def _price_predicates(filters: dict) -> list:
+    price_filter = filters["price"].lower()
+    if price_filter == 'cao':
+        return [lambda c: ~(c.has_price & (c.dollars < 2))]
+    if price_filter == 'thấp':
+        return [lambda c: ~(c.has_price & (c.dollars > 1))]
+    return []
+
+
+def _compile_food(filters: dict) -> list:
+    predicates = []
+
+    if filters.get("food_type"):
+        food_types_lower = [ft.lower() for ft in filters["food_type"]]
+        clauses = []
+        if 'quán ăn' in food_types_lower or 'nhà hàng' in food_types_lower:
+            clauses.append(lambda c: c.amenity_in('restaurant', 'fast_food') | c.name_contains('nhà hàng', 'quán ăn'))
+        if 'cafe' in food_types_lower or 'đồ uống' in food_types_lower:
+            clauses.append(lambda c: c.amenity_in('cafe', 'bar', 'pub') | c.name_contains('cafe', 'coffee'))
+        if 'bar' in food_types_lower:
+            clauses.append(lambda c: c.amenity_in('bar', 'pub') | c.name_contains('bar'))
+        if 'buffet' in food_types_lower:
+            clauses.append(lambda c: c.name_contains('buffet'))
+        predicates.append(_any_of(clauses))
+
+    if filters.get("cuisine"):
+        cuisine_filter_lower = [c.lower() for c in filters["cuisine"]]
+        clauses = []
+        for cuisine_filter in cuisine_filter_lower:
+            if 'món việt' in cuisine_filter:
+                clauses.append(lambda c: c.cuisine_contains('vietnamese') | c.name_contains('phở', 'bún', 'cơm'))
+            if 'mon á' in cuisine_filter or 'món á' in cuisine_filter:
+                clauses.append(lambda c: c.cuisine_contains('asian', 'japanese', 'korean', 'thai'))
+            if 'mon âu' in cuisine_filter or 'món âu' in cuisine_filter:
+                clauses.append(lambda c: c.cuisine_contains('french', 'italian', 'european'))
+            if 'chay' in cuisine_filter:
+                clauses.append(lambda c: c.cuisine_contains('vegan', 'vegetarian'))
+        if cuisine_filter_lower:
+            predicates.append(_any_of(clauses))
+
+    if filters.get("atmosphere"):
+        atmosphere_lower = [a.lower() for a in filters["atmosphere"]]
+        if 'yên tĩnh' in atmosphere_lower:
+            predicates.append(lambda c: ~c.outdoor)
+        if 'lãng mạn' in atmosphere_lower:
+            predicates.append(lambda c: ~c.name_contains('fast_food', 'quick'))
+
+    if filters.get("price"):
+        predicates.extend(_price_predicates(filters))
+    return predicates
+
+
+def _compile_entertainment(filters: dict) -> list:
+    predicates = []
+
+    if filters.get("activity_type"):
+        activity_types_lower = [at.lower() for at in filters["activity_type"]]
+        clauses = []
+        for activity_filter in activity_types_lower:
+            if 'xem phim' in activity_filter:
+                clauses.append(lambda c: c.amenity_contains('cinema', 'theater') | c.name_contains('phim'))
+            if 'triển lãm' in activity_filter:
+                clauses.append(lambda c: c.amenity_contains('museum', 'gallery') | c.name_contains('triển lãm'))
+            if 'thể thao' in activity_filter:
+                clauses.append(lambda c: c.amenity_contains('sports', 'gym', 'fitness'))
+            if 'karaoke' in activity_filter:
+                clauses.append(lambda c: c.amenity_contains('karaoke') | c.name_contains('karaoke'))
+            if 'mua sắm' in activity_filter:
+                clauses.append(lambda c: c.amenity_contains('shop', 'mall', 'market') | c.name_contains('shop'))
+        if activity_types_lower:
+            predicates.append(_any_of(clauses))
+
+    if filters.get("space"):
+        if 'trong nhà' in filters["space"].lower():
+            predicates.append(lambda c: ~c.outdoor)
+
+    if filters.get("price"):
+        predicates.extend(_price_predicates(filters))
+    return predicates
+
+
+def compile_filters(category: str, filters: dict) -> list:
+    """Turn the UI filters into column predicates (lowercased once per request, not once per place)."""
+    filters = filters or {}
+    if category == "Ăn uống":
+        return _compile_food(filters)
+    if category == "Giải trí":
+        return _compile_entertainment(filters)
+    return []
+
+
+def filter_mask(cols: PlaceColumns, predicates: list) -> np.ndarray:
+    mask = np.ones(cols.size, dtype=bool)
+    for predicate in predicates:
+        mask &= predicate(cols)
+    return mask
+
+
+def filter_places(places: list, category: str, filters: dict) -> list:
+    """Keep only places whose OSM tags match the category's filters (returned as a PlaceBatch)."""
+    predicates = compile_filters(category, filters)
+    if not predicates or not places:
+        return places.copy() if isinstance(places, PlaceBatch) else list(places)
+    cols = columns_of(places)
+    kept = cols.take(np.flatnonzero(filter_mask(cols, predicates)))
+    return PlaceBatch(kept.places, kept)
+
+
+def relevance_scores(cols: PlaceColumns, keyword: str = None, filters: dict = None) -> np.ndarray:
+    """Score in [0, 1]: closeness, keyword hit in name/cuisine, rating and soft preferences."""
+    filters = filters or {}
+    proximity = 1.0 / (1.0 + cols.distance)
+    rating = np.nan_to_num(cols.rating / 5.0, nan=0.0).clip(0.0, 1.0)
+
+    keyword_hit = cols.none()
+    folded_keyword = fold_vietnamese(keyword) if keyword else ""
+    if folded_keyword:
+        keyword_hit = cols.folded_contains(folded_keyword)
+
+    # "Ngoài trời" không loại quán nào (nhiều quán thiếu tag) nhưng quán có chỗ ngồi ngoài trời được cộng điểm
+    preference = cols.none()
+    if filters.get("space") and 'ngoài trời' in str(filters["space"]).lower():
+        preference = cols.outdoor.copy()
+
+    return (SCORE_WEIGHTS["proximity"] * proximity + SCORE_WEIGHTS["keyword"] * keyword_hit
+            + SCORE_WEIGHTS["rating"] * rating + SCORE_WEIGHTS["preference"] * preference)
+
+
+def rank_by_relevance(places: list, keyword: str = None, filters: dict = None, limit: int = None) -> list:
+    """Attach ``relevance`` and sort by it (ties keep distance order); keep only ``limit`` best if given."""
+    if not places:
+        return []
+    scores = relevance_scores(columns_of(places), keyword, filters)
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return [{**places[i], "relevance": round(float(scores[i]), 3)} for i in order]
@@ -0,0 +1,342 @@
+# File: backend/profiling.py
+# Profile từng request chậm theo yêu cầu (opt-in), không cần sửa code endpoint
+#
+# Bật bằng EAT_CHILL_PROFILE=1, rồi chọn cách kích hoạt:
+#   - Header "X-Profile: 1" (hoặc "X-Profile: <EAT_CHILL_PROFILE_TOKEN>" nếu có đặt token)
+# Xem / tải profile (/api/admin/profiles) bắt buộc phải đặt EAT_CHILL_PROFILE_TOKEN, không có thì trả 404.
+#   - EAT_CHILL_PROFILE_SAMPLE_RATE=0.01  -> profile ngẫu nhiên 1% request
+#   - EAT_CHILL_PROFILE_SLOW_MS=800       -> profile mọi request, chỉ lưu cái chạy lâu hơn 800 ms
+#
+# Một thread lấy mẫu stack (sys._current_frames) mỗi vài ms, chỉ của các thread đang chạy request
+# được profile, và chỉ chạy khi có request như vậy. Kết quả lưu dạng "collapsed stack"
+# (mỗi dòng "frame;frame;frame số_mẫu") mở được bằng flamegraph.pl hoặc https://www.speedscope.app.
+# Thư mục lưu giữ tối đa EAT_CHILL_PROFILE_KEEP profile, cũ nhất bị xoá trước.
+
+import contextvars
+import functools
+import hmac
+import inspect
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+PROFILE_ENABLED = os.environ.get("EAT_CHILL_PROFILE", "0") == "1"
+PROFILE_TOKEN = os.environ.get("EAT_CHILL_PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("EAT_CHILL_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.environ.get("EAT_CHILL_PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("EAT_CHILL_PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("EAT_CHILL_PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.environ.get("EAT_CHILL_PROFILE_KEEP", "50"))
+
+# Không profile chính các API xem profile và luồng SSE (mở hàng giờ liền)
+SKIP_PATH_PREFIXES = ("/api/admin/", "/api/itinerary/events")
+MAX_STACK_DEPTH = 128
+
+_PROFILE_ID = re.compile(r"^[0-9]+-[0-9]+-[0-9]+$")
+
+# Request đang được profile trong context hiện tại (anyio chép context sang thread của threadpool)
+_current_capture = contextvars.ContextVar("eat_chill_profile_capture", default=None)
+
+
+class Capture:
+    """Samples collected for one request."""
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = time.time()
+        self.thread_ids = set()
+        self.stacks = Counter()
+        self.samples = 0
+        self.status = None
+        self.duration_ms = None
+
+    def add_thread(self, thread_id: int):
+        self.thread_ids.add(thread_id)
+
+    def remove_thread(self, thread_id: int):
+        self.thread_ids.discard(thread_id)
+
+    def collapsed(self) -> str:
+        root = f"{self.method} {self.path}"
+        return "".join(f"{root};{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def meta(self) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "status": self.status,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+            "interval_ms": PROFILE_INTERVAL_MS,
+        }
+
+
+class StackSampler:
+    """One background thread sampling the stacks of threads registered in active captures.
+
+    Sleeps on an event while nothing is being profiled, so idle cost is zero.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self._captures = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._labels = {}  # code object -> nhãn frame (tính 1 lần cho mỗi hàm)
+
+    def start(self, capture: Capture):
+        with self._lock:
+            self._captures.add(capture)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="eat-chill-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, capture: Capture):
+        with self._lock:
+            self._captures.discard(capture)
+            if not self._captures:
+                self._wake.clear()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            # Giữ lock cả lượt lấy mẫu: stop() trả về thì capture không còn bị ghi thêm
+            with self._lock:
+                if not self._captures:
+                    continue
+                frames = sys._current_frames()
+                for capture in self._captures:
+                    for thread_id in list(capture.thread_ids):
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            capture.stacks[self._collapse(frame)] += 1
+                            capture.samples += 1
+                del frames
+
+    def _collapse(self, frame) -> str:
+        labels = []
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = _frame_label(code)
+            labels.append(label)
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+
+def _frame_label(code) -> str:
+    # "hàm (thư_mục/file.py:dòng)" giống py-spy; bỏ ";" để không phá định dạng collapsed
+    parts = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    location = "/".join(parts[-2:])
+    return f"{code.co_name} ({location}:{code.co_firstlineno})".replace(";", ",")
+
+
+class ProfileStore:
+    """Bounded on-disk ring buffer of captures (``<id>.folded`` + ``<id>.json``)."""
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+        self._seq = itertools.count(1)
+
+    def new_id(self) -> str:
+        # Tên file sắp theo thời gian; pid để nhiều worker ghi chung 1 thư mục không trùng
+        return f"{int(time.time() * 1000)}-{os.getpid()}-{next(self._seq)}"
+
+    def save(self, profile_id: str, capture: Capture):
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(f"{profile_id}.folded", capture.collapsed())
+        # Ghi .json sau cùng: có .json nghĩa là profile đã ghi xong
+        self._write(f"{profile_id}.json", json.dumps({"id": profile_id, **capture.meta()}))
+        self._prune()
+
+    def _write(self, name: str, text: str):
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+    def _ids(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = [name[:-5] for name in names if name.endswith(".json") and _PROFILE_ID.match(name[:-5])]
+        return sorted(ids, key=lambda i: tuple(map(int, i.split("-"))), reverse=True)
+
+    def _prune(self):
+        for profile_id in self._ids()[self.keep:]:
+            for ext in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + ext))
+                except FileNotFoundError:
+                    pass  # Worker khác đã xoá
+
+    def list(self) -> list:
+        """Metadata of stored profiles, newest first."""
+        profiles = []
+        for profile_id in self._ids():
+            try:
+                with open(os.path.join(self.directory, profile_id + ".json"), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue
+        return profiles
+
+    def path(self, profile_id: str):
+        """Path of the collapsed-stack file, or None for unknown/invalid ids."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + ".folded")
+        return path if os.path.exists(path) else None
+
+
+sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_KEEP)
+
+
+def _same_token(value: str) -> bool:
+    # compare_digest trên str báo TypeError nếu có ký tự ngoài ASCII (header giải mã latin-1) -> so sánh bytes
+    return hmac.compare_digest(value.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
+
+
+def token_ok(value: str) -> bool:
+    """Header value allowed to trigger a profile."""
+    if PROFILE_TOKEN:
+        return _same_token(value)
+    return value.lower() in ("1", "true", "yes")
+
+
+def admin_token_ok(value: str) -> bool:
+    """Header value allowed to list/download profiles: only the configured token, never "1"."""
+    return PROFILE_ENABLED and bool(PROFILE_TOKEN) and _same_token(value)
+
+
+def profiling_config() -> dict:
+    return {
+        "enabled": PROFILE_ENABLED,
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "slow_ms": PROFILE_SLOW_MS,
+        "interval_ms": PROFILE_INTERVAL_MS,
+        "keep": PROFILE_KEEP,
+    }
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute that registers the thread running the endpoint with the request's capture.
+
+    Sync endpoints run in the threadpool, so the sampler must know which worker
+    thread to look at. Async endpoints register the event loop thread (their
+    profile then also shows whatever else the loop ran meanwhile).
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _track_thread(endpoint), **kwargs)
+
+
+def _track_thread(endpoint):
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def tracked(*args, **kwargs):
+            capture = _current_capture.get()
+            if capture is None:
+                return await endpoint(*args, **kwargs)
+            thread_id = threading.get_ident()
+            capture.add_thread(thread_id)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                capture.remove_thread(thread_id)
+        return tracked
+
+    @functools.wraps(endpoint)
+    def tracked(*args, **kwargs):
+        capture = _current_capture.get()
+        if capture is None:
+            return endpoint(*args, **kwargs)
+        thread_id = threading.get_ident()
+        capture.add_thread(thread_id)
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            capture.remove_thread(thread_id)
+    return tracked
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware deciding which requests to profile and saving their captures.
+
+    Requests that are not profiled pass straight through (one header lookup and
+    one random draw).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not PROFILE_ENABLED or scope["type"] != "http" or scope["path"].startswith(SKIP_PATH_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        capture = Capture(scope["method"], scope["path"], trigger)
+        # Kích hoạt bằng header/ngẫu nhiên thì chắc chắn lưu -> trả id ngay trong header
+        profile_id = profile_store.new_id() if trigger != "slow" else None
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                capture.status = message["status"]
+                if profile_id:
+                    message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        context_token = _current_capture.set(capture)
+        sampler.start(capture)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop(capture)
+            _current_capture.reset(context_token)
+            capture.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        if profile_id is None and capture.duration_ms >= PROFILE_SLOW_MS:
+            profile_id = profile_store.new_id()
+        if profile_id:
+            try:
+                await run_in_threadpool(profile_store.save, profile_id, capture)
+            except OSError as e:
+                print(f"Lỗi lưu profile {profile_id}: {e}")
+
+    def _trigger(self, scope):
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                if token_ok(value.decode("latin-1")):
+                    return "header"
+                break
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return "sample"
+        if PROFILE_SLOW_MS > 0:
+            return "slow"
+        return None
@@ -0,0 +1,207 @@
+# File: backend/store.py
+# Kho dữ liệu dùng chung giữa các worker (SQLite, chế độ WAL)
+#
+# Mặc định dùng SQLite in-memory (1 process, tắt server là mất - giống trước đây).
+# Muốn chạy nhiều worker thì trỏ tất cả worker vào cùng 1 file:
+#   EAT_CHILL_STORE_PATH=eat_chill.db uvicorn backend.main:app --workers 4
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+STORE_PATH = os.environ.get("EAT_CHILL_STORE_PATH", ":memory:")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS itinerary (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS legs (
+    item_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+
+class SharedStore:
+    """Itinerary + upstream cache stored in SQLite so every worker sees the same state."""
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Mã ngẫu nhiên của kho, tạo 1 lần khi kho mới được tạo (worker sau dùng lại mã đã có).
+        # Kho in-memory mất khi restart -> mã mới, bộ đếm itinerary_version bắt đầu lại mà ETag cũ vẫn không khớp
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_epoch', ?)",
+                           (json.dumps(secrets.token_hex(8)),))
+        self.epoch = self.get_meta("store_epoch")
+
+    @contextmanager
+    def transaction(self):
+        """Serialize a read-modify-write across threads and processes (BEGIN IMMEDIATE)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # ----- Itinerary -----
+
+    def list_itinerary(self) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, data FROM itinerary ORDER BY id").fetchall()
+        return [{**json.loads(data), "id": item_id} for item_id, data in rows]
+
+    def add_itinerary_item(self, item: dict) -> int:
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO itinerary (data) VALUES (?)", (json.dumps(item),))
+            self._bump_itinerary_version()
+            return cursor.lastrowid
+
+    def add_itinerary_items(self, items: list) -> list:
+        with self._lock:
+            return [self.add_itinerary_item(item) for item in items]
+
+    def iter_itinerary(self, batch_size: int = 500):
+        """Yield items sorted by start time, reading one page at a time (for large exports)."""
+        last_start, last_id = "", 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, data, json_extract(data, '$.start_time') AS start_time FROM itinerary "
+                    "WHERE start_time > ? OR (start_time = ? AND id > ?) "
+                    "ORDER BY start_time, id LIMIT ?",
+                    (last_start, last_start, last_id, batch_size),
+                ).fetchall()
+            for item_id, data, _ in rows:
+                yield {**json.loads(data), "id": item_id}
+            if len(rows) < batch_size:
+                return
+            last_id, _, last_start = rows[-1]
+
+    def update_itinerary_item(self, item_id: int, item: dict) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("UPDATE itinerary SET data = ? WHERE id = ?", (json.dumps(item), item_id))
+            if cursor.rowcount > 0:
+                self._bump_itinerary_version()
+            return cursor.rowcount > 0
+
+    def delete_itinerary_item(self, item_id: int) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM itinerary WHERE id = ?", (item_id,))
+            if cursor.rowcount > 0:
+                self._bump_itinerary_version()
+            return cursor.rowcount > 0
+
+    def clear_itinerary(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM itinerary")
+            self._conn.execute("DELETE FROM legs")
+            self._bump_itinerary_version()
+
+    def itinerary_version(self) -> int:
+        """Counter bumped by every itinerary mutation (shared by all workers)."""
+        return self.get_meta("itinerary_version", 0)
+
+    def _bump_itinerary_version(self):
+        # 1 câu lệnh nên tăng đúng cả khi nhiều process cùng ghi
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('itinerary_version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    # ----- Legs (đoạn đường giữa 2 điểm liên tiếp của lịch trình) -----
+
+    def get_legs(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT item_id, data FROM legs").fetchall()
+        return {item_id: json.loads(data) for item_id, data in rows}
+
+    def set_leg(self, item_id: int, leg: dict):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO legs (item_id, data) VALUES (?, ?)", (item_id, json.dumps(leg)))
+
+    def delete_legs(self, item_ids: list):
+        with self._lock:
+            self._conn.executemany("DELETE FROM legs WHERE item_id = ?", [(i,) for i in item_ids])
+
+    # ----- Meta -----
+
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key: str, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    # ----- Cache -----
+
+    def cache_get(self, namespace: str, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def cache_get_many(self, namespace: str, keys: list) -> dict:
+        """Look up many keys at once; returns {key: value} for the ones found and not expired."""
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        for start in range(0, len(keys), 500):  # SQLite giới hạn số tham số trong 1 câu lệnh
+            chunk = keys[start:start + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE namespace = ? AND expires_at > ? "
+                    f"AND key IN ({','.join('?' * len(chunk))})",
+                    (namespace, now, *chunk),
+                ).fetchall()
+            found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def cache_set_many(self, namespace: str, items: dict, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                [(namespace, key, json.dumps(value), now + ttl) for key, value in items.items()],
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+    def cache_set(self, namespace: str, key: str, value, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now + ttl),
+            )
+            # Dọn bớt entry hết hạn
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+
+store = SharedStore()
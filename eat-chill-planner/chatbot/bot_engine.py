@@ -1,21 +1,171 @@
 # File: chatbot/bot_engine.py
 import json
+import os
+import time
 import requests
 from chatbot.prompts import SYSTEM_PROMPT
+from chatbot.conversation import (
+    get_conversation, parse_refinement, refine_locally, refined_payload, remember_results,
+)
+from chatbot.scheduler import llm_scheduler, RequestCancelled, SchedulerTimeout
 
-BACKEND_URL = "http://127.0.0.1:8000/api/search"
+BACKEND_URL = os.environ.get("EAT_CHILL_BACKEND_URL", "http://127.0.0.1:8000") + "/api/search"
+
+OLLAMA_MODEL = 'llama3.2:1b'
+# Giữ model trong RAM của Ollama giữa các lượt chat (mặc định Ollama tự unload sau 5 phút)
+OLLAMA_KEEP_ALIVE = os.environ.get("EAT_CHILL_OLLAMA_KEEP_ALIVE", "30m")
+
+_ollama = None
+
+
+def _load_ollama():
+    """Import the ollama client on first use (it pulls in httpx); raises ImportError if missing."""
+    global _ollama
+    if _ollama is None:
+        import ollama
+        _ollama = ollama
+    return _ollama
+
+
+def warm_up_model():
+    """Load the chat model into Ollama ahead of the first message (empty prompt = load only)."""
+    try:
+        _load_ollama().generate(model=OLLAMA_MODEL, prompt='', keep_alive=OLLAMA_KEEP_ALIVE)
+        return True
+    except Exception as e:
+        print(f"Ollama warm-up failed: {e}")
+        return False
+
+
+def answer_refinement(user_message, session_id):
+    """Answer "cái nào gần nhất?" / "chỉ quán chay thôi" from the session's last results.
+
+    Returns None when the message is not a refinement (or there is nothing to refine).
+    """
+    state = get_conversation(session_id)
+    if state is None:
+        return None
+    refinement = parse_refinement(user_message, state)
+    if refinement is None:
+        return None
+
+    places = refine_locally(state, refinement)
+    intro = "Trong các địa điểm vừa tìm"
+    if not places and state.truncated and refinement["filters"]:
+        # Kết quả đã lấy về không đủ -> tìm lại ở backend với bộ lọc mới
+        payload = refined_payload(state, refinement)
+        try:
+            api_res = requests.post(BACKEND_URL, json=payload, timeout=5)
+            if api_res.status_code != 200:
+                return f"Lỗi kết nối backend (status {api_res.status_code})."
+            remember_results(session_id, payload, api_res.json().get("places", []))
+        except Exception as e:
+            return f"Lỗi kết nối backend: {e}"
+        places = refine_locally(get_conversation(session_id), {**refinement, "filters": {}})
+        intro = "Mình tìm thêm"
+
+    if not places:
+        return f"{intro} không có chỗ nào phù hợp. Bạn thử bỏ bớt điều kiện xem sao?"
+    reply = f"{intro}, có {len(places)} chỗ phù hợp:\n"
+    for p in places[:refinement["top_k"] or 3]:
+        reply += f"- {p['name']} ({p.get('distance', 0)}km) - ⭐{p.get('rating', 'N/A')}\n"
+        reply += f"  Địa chỉ: {p.get('address', 'N/A')}\n"
+    return reply
+
+
+def chat_with_ollama(user_message, session_id=None):
+    """Chat with Ollama and execute backend logic based on intent.
+
+    LLM calls go through ``llm_scheduler``; a new message with the same
+    ``session_id`` cancels this one if it is still waiting. Follow-up questions
+    about the places just shown in that session are answered locally.
+    Blocking wrapper around :func:`stream_chat`: returns the whole reply text.
+    """
+    return "".join(event["text"] for event in stream_chat(user_message, session_id) if event["type"] == "text")
+
+
+def stream_chat(user_message, session_id=None):
+    """Same chat turn as :func:`chat_with_ollama`, as a stream of events for the UI.
+
+    Yields dicts with a ``type``:
+
+    - ``ack``: right away, before any LLM or backend call
+    - ``token``: a piece of the model output while Ollama is still generating
+    - ``places``: search results, as soon as the backend answers
+    - ``text``: a piece of the reply (all ``text`` joined = the full reply)
+    - ``done``: last event, ``timings`` in ms (``first_token_ms``, ``first_text_ms``, ``total_ms``)
+    """
+    started = time.perf_counter()
+    timings = {}
+
+    def elapsed_ms():
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    yield {"type": "ack", "text": "Đã nhận, đang xử lý..."}
+    for event in _chat_events(user_message, session_id):
+        if event["type"] == "token":
+            timings.setdefault("first_token_ms", elapsed_ms())
+        elif event["type"] == "text":
+            timings.setdefault("first_text_ms", elapsed_ms())
+        yield event
+    timings["total_ms"] = elapsed_ms()
+    yield {"type": "done", "timings": timings}
+
+
+def _text(text):
+    return {"type": "text", "text": text}
+
+
+def _backend_error_reply(e):
+    if isinstance(e, requests.exceptions.Timeout):
+        return "Lỗi: Backend không phản hồi. Vui lòng kiểm tra server."
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return "Lỗi: Không thể kết nối đến backend. Kiểm tra xem http://127.0.0.1:8000 có chạy không?"
+    return f"Lỗi gọi API: {e}"
+
+
+def _search_events(payload, session_id, found_label, empty_reply, with_address=True,
+                   error_prefix="Lỗi kết nối backend", on_error=_backend_error_reply):
+    """Call /api/search; yield a ``places`` event as soon as it answers, then the reply line by line."""
+    try:
+        api_res = requests.post(BACKEND_URL, json=payload, timeout=5)
+        if api_res.status_code != 200:
+            yield _text(f"{error_prefix} (status {api_res.status_code}).")
+            return
+        places = api_res.json().get("places", [])
+    except Exception as e:
+        yield _text(on_error(e))
+        return
+
+    remember_results(session_id, payload, places)
+    yield {"type": "places", "places": places}
+    if not places:
+        yield _text(empty_reply)
+        return
+    yield _text(f"Mình tìm thấy {len(places)} {found_label}:\n")
+    for p in places[:3]:
+        line = f"- {p['name']} ({p.get('distance', 0)}km) - ⭐{p.get('rating', 'N/A')}\n"
+        if with_address:
+            line += f"  Địa chỉ: {p.get('address', 'N/A')}\n"
+        yield _text(line)
+
+
+def _chat_events(user_message, session_id):
+    refined_reply = answer_refinement(user_message, session_id)
+    if refined_reply is not None:
+        yield _text(refined_reply)
+        return
 
-def chat_with_ollama(user_message):
-    """Chat with Ollama and execute backend logic based on intent."""
     try:
         # Check if Ollama is available
-        import ollama
+        ollama = _load_ollama()
     except ImportError:
         # Fallback: Ollama not installed — perform a simple keyword-based search via backend
         low = user_message.lower()
         # Simple intent detection fallback
         if any(w in low for w in ["chào", "xin chào", "hi", "hello"]):
-            return "Chào bạn! Mình là trợ lý Eat & Chill. Bạn cần tìm quán ăn hay chỗ chơi?"
+            yield _text("Chào bạn! Mình là trợ lý Eat & Chill. Bạn cần tìm quán ăn hay chỗ chơi?")
+            return
 
         # Build a heuristic search payload
         keyword = ""
@@ -37,29 +187,27 @@ def chat_with_ollama(user_message):
             "category": category,
             "filters": filters
         }
-        try:
-            api_res = requests.post(BACKEND_URL, json=payload, timeout=5)
-            if api_res.status_code == 200:
-                places = api_res.json().get("places", [])
-                if not places:
-                    return "Mình tìm rồi nhưng không thấy địa điểm phù hợp."
-                reply = f"Mình tìm thấy {len(places)} địa điểm:\n"
-                for p in places[:3]:
-                    reply += f"- {p['name']} ({p.get('distance',0)}km) - ⭐{p.get('rating','N/A')}\n"
-                return reply
-            else:
-                return f"Lỗi kết nối backend (status {api_res.status_code})."
-        except Exception:
-            return "Lỗi: Không thể kết nối backend để tìm quán (fallback)."
+        yield from _search_events(payload, session_id, "địa điểm", "Mình tìm rồi nhưng không thấy địa điểm phù hợp.",
+                                  with_address=False,
+                                  on_error=lambda e: "Lỗi: Không thể kết nối backend để tìm quán (fallback).")
+        return
     
     try:
-        # 1. Call Ollama to extract intent and entities
+        # 1. Call Ollama to extract intent and entities (streamed token by token)
         # Use llama3.2:1b if llama3 is not available
-        response = ollama.chat(model='llama3.2:1b', messages=[
-            {'role': 'system', 'content': SYSTEM_PROMPT},
-            {'role': 'user', 'content': user_message},
-        ])
-        ai_content = response['message']['content']
+        ai_content = ""
+        with llm_scheduler.slot(session_id) as ticket:
+            for chunk in ollama.chat(model=OLLAMA_MODEL, messages=[
+                {'role': 'system', 'content': SYSTEM_PROMPT},
+                {'role': 'user', 'content': user_message},
+            ], keep_alive=OLLAMA_KEEP_ALIVE, stream=True):
+                # Có tin nhắn mới / quá hạn thì dừng sinh token ngay, trả slot cho người khác
+                ticket.raise_if_stale()
+                token = chunk['message']['content']
+                if token:
+                    ai_content += token
+                    yield {"type": "token", "text": token}
+            ticket.raise_if_stale()
         
         # Clean up JSON string (sometimes Ollama adds extra text or markdown)
         json_str = ai_content.strip()
@@ -92,7 +240,7 @@ def chat_with_ollama(user_message):
 
         # 2. Handle different intents (match common variations)
         if any(w in intent for w in ["greeting", "chao", "hello", "hi"]):
-            return "Chào bạn! Mình là trợ lý Eat & Chill. Bạn cần tìm quán ăn hay chỗ chơi?"
+            yield _text("Chào bạn! Mình là trợ lý Eat & Chill. Bạn cần tìm quán ăn hay chỗ chơi?")
 
         elif any(w in intent for w in ["search", "search_place", "tim", "find"]):
             # Call backend API with keyword/category
@@ -103,40 +251,19 @@ def chat_with_ollama(user_message):
             payload = {
                 "lat": 10.762622, 
                 "lon": 106.660172, 
-                "keyword": "",  # Don't use keyword search (text index not working properly)
+                "keyword": keyword,  # Matched against the backend's name index (diacritic-insensitive)
                 "category": category or "Ăn uống",  # Default to food category
                 "filters": {}
             }
             
-            try:
-                api_res = requests.post(BACKEND_URL, json=payload, timeout=5)
-                if api_res.status_code == 200:
-                    places = api_res.json().get("places", [])
-                    if not places:
-                        return "Mình tìm rồi nhưng không thấy quán nào phù hợp."
-                    
-                    # Build response with top 3 places
-                    reply = f"Mình tìm thấy {len(places)} địa điểm cho bạn:\n"
-                    for p in places[:3]:
-                        distance = p.get('distance', 0)
-                        rating = p.get('rating', 'N/A')
-                        reply += f"- {p['name']} ({distance}km) - ⭐{rating}\n"
-                        reply += f"  Địa chỉ: {p.get('address', 'N/A')}\n"
-                    return reply
-                else:
-                    return f"Lỗi kết nối backend (status {api_res.status_code})."
-            except requests.exceptions.Timeout:
-                return "Lỗi: Backend không phản hồi. Vui lòng kiểm tra server."
-            except requests.exceptions.ConnectionError:
-                return "Lỗi: Không thể kết nối đến backend. Kiểm tra xem http://127.0.0.1:8000 có chạy không?"
-            except Exception as e:
-                return f"Lỗi gọi API: {e}"
+            yield from _search_events(payload, session_id, "địa điểm cho bạn", "Mình tìm rồi nhưng không thấy quán nào phù hợp.",
+                                      on_error=_backend_error_reply)
 
         elif any(w in intent for w in ["add", "itinerary", "lich", "schedule"]):
-            return "Tính năng thêm vào lịch qua chat đang phát triển. Bạn dùng nút trên web nhé!"
+            yield _text("Tính năng thêm vào lịch qua chat đang phát triển. Bạn dùng nút trên web nhé!")
 
         else:
-            return "Xin lỗi, mình chưa hiểu ý bạn. Bạn thử hỏi 'Tìm quán lẩu' xem sao?"
+            yield _text("Xin lỗi, mình chưa hiểu ý bạn. Bạn thử hỏi 'Tìm quán lẩu' xem sao?")
 
     except json.JSONDecodeError as jde:
         # If JSON parsing fails, use fallback keyword-based logic
@@ -145,7 +272,8 @@ def chat_with_ollama(user_message):
         
         # Check for greeting
         if any(w in low for w in ["chào", "hello", "hi", "xin chào"]):
-            return "Chào bạn! Mình là trợ lý Eat & Chill. Bạn cần tìm quán ăn hay chỗ chơi?"
+            yield _text("Chào bạn! Mình là trợ lý Eat & Chill. Bạn cần tìm quán ăn hay chỗ chơi?")
+            return
         
         # Check for search intent (more specific keywords)
         is_search = any(w in low for w in ["tìm", "find", "search", "quán", "nhà hàng", "cafe", "phở", "lẩu", "hàn", "việt"])
@@ -158,24 +286,15 @@ def chat_with_ollama(user_message):
             "category": "Ăn uống" if is_search else "",
             "filters": {}
         }
-        try:
-            api_res = requests.post(BACKEND_URL, json=payload, timeout=5)
-            if api_res.status_code == 200:
-                places = api_res.json().get("places", [])
-                if not places:
-                    return "Mình tìm rồi nhưng không thấy quán nào phù hợp."
-                reply = f"Mình tìm thấy {len(places)} địa điểm:\n"
-                for p in places[:3]:
-                    reply += f"- {p['name']} ({p.get('distance',0)}km) - ⭐{p.get('rating','N/A')}\n"
-                    reply += f"  Địa chỉ: {p.get('address', 'N/A')}\n"
-                return reply
-            else:
-                return f"Lỗi backend (status {api_res.status_code})."
-        except Exception as e:
-            return f"Lỗi kết nối backend: {e}"
+        yield from _search_events(payload, session_id, "địa điểm", "Mình tìm rồi nhưng không thấy quán nào phù hợp.",
+                                  error_prefix="Lỗi backend", on_error=lambda e: f"Lỗi kết nối backend: {e}")
     
+    except RequestCancelled:
+        yield _text("(Đã bỏ qua tin nhắn này vì bạn vừa gửi tin nhắn mới.)")
+    except SchedulerTimeout:
+        yield _text("Bot đang bận trả lời nhiều người, bạn thử lại sau ít phút nhé!")
     except KeyError as e:
-        return f"Lỗi: Thiếu field {e} trong response từ Ollama."
+        yield _text(f"Lỗi: Thiếu field {e} trong response từ Ollama.")
     except Exception as e:
         print(f"Lỗi Bot: {e}")
-        return f"Bot đang bị lỗi: {str(e)[:100]}"
\ No newline at end of file
+        yield _text(f"Bot đang bị lỗi: {str(e)[:100]}")
\ No newline at end of file
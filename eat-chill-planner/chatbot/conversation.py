@@ -0,0 +1,153 @@
+# File: chatbot/conversation.py
+# Nhớ kết quả tìm kiếm gần nhất của mỗi phiên chat để trả lời câu hỏi tiếp theo tại chỗ
+#
+# Ví dụ: "Tìm quán ăn" -> backend trả 20 quán. Sau đó "cái nào gần nhất?" hoặc
+# "chỉ quán chay thôi" được lọc/sắp xếp ngay trên 20 quán đó, không gọi lại Overpass.
+# Chỉ khi lọc xong không còn quán nào mà lần trước bị cắt bớt thì mới tìm lại.
+
+import re
+import threading
+from collections import OrderedDict
+
+MAX_CONVERSATIONS = 500
+
+# Câu hỏi tiếp nối thường có các từ này (không bắt đầu bằng "tìm")
+REFINE_CUES = ["chỉ", "cái nào", "quán nào", "chỗ nào", "thôi", "lọc", "trong đó", "gần nhất", "gần đây nhất",
+               "đánh giá cao", "ngon nhất", "rẻ", "top"]
+# "top 3", "top3", "5 quán"... (cũng tính là câu hỏi tiếp nối)
+TOP_K_PATTERN = re.compile(r"top\s*(\d+)|(\d+)\s*(quán|chỗ|địa điểm)")
+# Chỉ dùng cụm nhiều âm tiết: "ý", "thái", "hàn", "nhật", "pháp" đứng riêng là từ thường ("chú ý", "phương pháp")
+CUISINE_CUES = {
+    "Chay": ["chay"],
+    "Món Việt": ["món việt", "việt nam"],
+    "Món Á": ["món á", "món hàn", "hàn quốc", "món nhật", "nhật bản", "món thái", "thái lan"],
+    "Món Âu": ["món âu", "món pháp", "món ý", "đồ tây", "món tây"],
+}
+PRICE_CUES = {
+    "Thấp": ["rẻ", "bình dân"],
+    "Cao": ["sang", "cao cấp", "đắt"],
+}
+# Món / loại chỗ: câu nhắc tới món khác với lần tìm trước là câu tìm mới ("quán bún bò gần nhất" sau khi tìm phở)
+SUBJECT_CUES = ["phở", "bún", "bún bò", "bún chả", "hủ tiếu", "mì", "cơm", "cơm tấm", "bánh mì", "bánh xèo", "lẩu",
+                "nướng", "bbq", "hải sản", "ốc", "gà", "vịt", "bò", "dê", "pizza", "burger", "sushi", "dimsum",
+                "cafe", "cà phê", "coffee", "trà sữa", "trà", "sinh tố", "kem", "chè", "bia", "bar", "pub", "buffet",
+                "karaoke", "phim", "rạp", "bảo tàng", "triển lãm", "công viên", "gym", "mua sắm"]
+CATEGORY_CUES = {
+    "Ăn uống": ["quán ăn", "nhà hàng", "đồ ăn", "ăn uống"],
+    "Giải trí": ["giải trí", "đi chơi", "chỗ chơi", "vui chơi"],
+}
+
+
+class ConversationState:
+    def __init__(self, payload: dict, places: list, truncated: bool):
+        self.payload = payload      # Payload /api/search đã gửi
+        self.places = places        # Kết quả backend trả về
+        self.truncated = truncated  # Backend có cắt bớt kết quả không (còn quán chưa lấy về)
+
+
+_conversations = OrderedDict()
+_lock = threading.Lock()
+
+
+def remember_results(session_id, payload: dict, places: list, page_size: int = 20):
+    """Store the latest search of a chat session (LRU-bounded)."""
+    if session_id is None:
+        return
+    with _lock:
+        _conversations[session_id] = ConversationState(payload, places, truncated=len(places) >= page_size)
+        _conversations.move_to_end(session_id)
+        while len(_conversations) > MAX_CONVERSATIONS:
+            _conversations.popitem(last=False)
+
+
+def get_conversation(session_id):
+    with _lock:
+        return _conversations.get(session_id)
+
+
+def _mentions(text: str, cue: str) -> bool:
+    """``cue`` appears in ``text`` as whole words."""
+    return re.search(rf"(?<!\w){re.escape(cue)}(?!\w)", text) is not None
+
+
+def _state_category(state: ConversationState) -> str:
+    return (state.payload.get("filters") or {}).get("category") or state.payload.get("category") or ""
+
+
+def names_new_subject(low: str, state: ConversationState) -> bool:
+    """True if the message asks for another dish/kind of place or category than the last search."""
+    from backend.name_index import fold_vietnamese
+
+    searched = f" {fold_vietnamese(state.payload.get('keyword') or '')} "
+    for cue in SUBJECT_CUES:
+        if _mentions(low, cue) and f" {fold_vietnamese(cue)} " not in searched:
+            return True
+    category = _state_category(state)
+    return any(name != category and any(_mentions(low, c) for c in cues) for name, cues in CATEGORY_CUES.items())
+
+
+def parse_refinement(user_message: str, state: ConversationState = None):
+    """Extract a follow-up refinement from the message, or None if it looks like a new request.
+
+    With ``state``, a message naming a different dish or category than the last
+    search counts as a new request too.
+    Returns ``{"sort": "distance"|"rating"|None, "filters": {...}, "top_k": int|None}``.
+    """
+    low = user_message.lower().strip()
+    # So khớp nguyên từ: "rẻ" không được khớp trong "giới trẻ"
+    if low.startswith("tìm") or not (any(_mentions(low, cue) for cue in REFINE_CUES) or TOP_K_PATTERN.search(low)):
+        return None
+    if state is not None and names_new_subject(low, state):
+        return None
+
+    filters = {}
+    cuisines = [name for name, cues in CUISINE_CUES.items() if any(_mentions(low, c) for c in cues)]
+    if cuisines:
+        filters["cuisine"] = cuisines
+    for price, cues in PRICE_CUES.items():
+        if any(_mentions(low, c) for c in cues):
+            filters["price"] = price
+
+    sort = None
+    if _mentions(low, "gần"):
+        sort = "distance"
+    elif any(_mentions(low, c) for c in ["đánh giá", "ngon nhất", "rating"]):
+        sort = "rating"
+
+    top_k = None
+    match = TOP_K_PATTERN.search(low)
+    if match:
+        top_k = int(match.group(1) or match.group(2))
+    elif any(_mentions(low, c) for c in ["nhất", "cái nào", "quán nào", "chỗ nào"]) and sort:
+        top_k = 1
+
+    if not filters and sort is None and top_k is None:
+        return None
+    return {"sort": sort, "filters": filters, "top_k": top_k}
+
+
+def refine_locally(state: ConversationState, refinement: dict) -> list:
+    """Apply a refinement to the stored places with the backend's own filter logic."""
+    from backend.place_filters import filter_places
+
+    places = state.places
+    if refinement["filters"]:
+        category = _state_category(state)
+        places = filter_places(places, "Giải trí" if category == "Giải trí" else "Ăn uống", refinement["filters"])
+
+    if refinement["sort"] == "distance":
+        places = sorted(places, key=lambda p: p.get("distance") or 0)
+    elif refinement["sort"] == "rating":
+        places = sorted(places, key=lambda p: (p.get("rating") is None, -(p.get("rating") or 0)))
+
+    if refinement["top_k"]:
+        places = places[:refinement["top_k"]]
+    return places
+
+
+def refined_payload(state: ConversationState, refinement: dict) -> dict:
+    """Search payload for re-querying the backend when local results are not enough."""
+    payload = dict(state.payload)
+    category = payload.get("category") or "Ăn uống"
+    payload["filters"] = {**(payload.get("filters") or {}), **refinement["filters"], "category": category}
+    return payload
@@ -0,0 +1,132 @@
+# File: chatbot/scheduler.py
+# Hàng đợi gọi Ollama: giới hạn số request chạy cùng lúc, có deadline và hủy theo phiên chat
+#
+# Ollama local chỉ xử lý hiệu quả 1 vài request cùng lúc. Nhiều phiên Streamlit chat
+# cùng lúc sẽ xếp hàng ở đây (FIFO) thay vì dồn hết vào Ollama rồi timeout lung tung.
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+LLM_SLOTS = int(os.environ.get("EAT_CHILL_LLM_SLOTS", "1"))
+LLM_DEADLINE_SECONDS = float(os.environ.get("EAT_CHILL_LLM_DEADLINE", "60"))
+
+
+class SchedulerTimeout(Exception):
+    """The request did not get (or finish in) an LLM slot before its deadline."""
+
+
+class RequestCancelled(Exception):
+    """A newer message from the same chat session replaced this request."""
+
+
+class LLMTicket:
+    def __init__(self, session_id, deadline: float):
+        self.session_id = session_id
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.cancelled = False
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def raise_if_stale(self):
+        """Call after the LLM returns: drop results nobody is waiting for anymore."""
+        if self.cancelled:
+            raise RequestCancelled()
+        if self.remaining() <= 0:
+            raise SchedulerTimeout()
+
+
+class LLMScheduler:
+    """FIFO queue in front of the LLM with a fixed number of concurrent slots."""
+
+    def __init__(self, slots: int = LLM_SLOTS, deadline_seconds: float = LLM_DEADLINE_SECONDS):
+        self.slots = max(1, slots)
+        self.deadline_seconds = deadline_seconds
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._in_flight = 0
+        self._latest = {}  # session_id -> ticket mới nhất của phiên đó
+        self._waits = deque(maxlen=1000)
+        self._counts = {"completed": 0, "cancelled": 0, "timed_out": 0}
+        self._peak_queue_depth = 0
+
+    @contextmanager
+    def slot(self, session_id=None, deadline_seconds: float = None):
+        """Wait for a free slot, then hold it for the ``with`` block.
+
+        A new request from the same ``session_id`` cancels the previous one if it is
+        still queued (and marks it cancelled if it is already running).
+        """
+        ticket = LLMTicket(session_id, time.monotonic() + (deadline_seconds or self.deadline_seconds))
+        with self._cond:
+            if session_id is not None:
+                previous = self._latest.get(session_id)
+                if previous is not None:
+                    previous.cancelled = True
+                self._latest[session_id] = ticket
+            self._queue.append(ticket)
+            self._peak_queue_depth = max(self._peak_queue_depth, len(self._queue))
+            self._cond.notify_all()
+
+            while True:
+                if ticket.cancelled:
+                    self._leave_queue(ticket, "cancelled")
+                    raise RequestCancelled()
+                if self._queue[0] is ticket and self._in_flight < self.slots:
+                    self._queue.popleft()
+                    self._in_flight += 1
+                    self._waits.append(time.monotonic() - ticket.enqueued_at)
+                    self._cond.notify_all()
+                    break
+                remaining = ticket.remaining()
+                if remaining <= 0:
+                    self._leave_queue(ticket, "timed_out")
+                    raise SchedulerTimeout()
+                self._cond.wait(remaining)
+
+        outcome = "completed"
+        try:
+            yield ticket
+        except RequestCancelled:
+            outcome = "cancelled"
+            raise
+        except SchedulerTimeout:
+            outcome = "timed_out"
+            raise
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._counts[outcome] += 1
+                if self._latest.get(session_id) is ticket:
+                    del self._latest[session_id]
+                self._cond.notify_all()
+
+    def _leave_queue(self, ticket: LLMTicket, outcome: str):
+        self._queue.remove(ticket)
+        self._counts[outcome] += 1
+        if self._latest.get(ticket.session_id) is ticket:
+            del self._latest[ticket.session_id]
+        self._cond.notify_all()
+
+    def metrics(self) -> dict:
+        """Queue depth, slot usage, outcome counts and wait-time percentiles (ms)."""
+        with self._cond:
+            waits = sorted(self._waits)
+            snapshot = {
+                "slots": self.slots,
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._queue),
+                "peak_queue_depth": self._peak_queue_depth,
+                **self._counts,
+            }
+        for name, pct in (("wait_ms_p50", 0.50), ("wait_ms_p95", 0.95)):
+            snapshot[name] = round(waits[min(len(waits) - 1, int(pct * len(waits)))] * 1000, 1) if waits else 0.0
+        snapshot["wait_ms_max"] = round(waits[-1] * 1000, 1) if waits else 0.0
+        return snapshot
+
+
+llm_scheduler = LLMScheduler()
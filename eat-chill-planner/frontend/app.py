@@ -8,11 +8,12 @@ project_root = str(Path(__file__).parent.parent)
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
+import functools
+import time
+
 import streamlit as st
 import requests
-import pandas as pd
-import folium
-from streamlit_folium import st_folium
+# folium / streamlit_folium được import ở phần bản đồ (chỉ khi cần vẽ)
 
 # Cấu hình trang
 st.set_page_config(page_title="Eat & Chill Planner", layout="wide")
@@ -24,6 +25,7 @@ BACKEND_URL = "http://127.0.0.1:8000"
 DEFAULT_LAT = 10.762622
 DEFAULT_LON = 106.660172
 
+page_started = time.perf_counter()
 st.title("Eat & Chill Planner 🗺️")
 
 # --- Khởi tạo Session State ---
@@ -35,6 +37,42 @@ if 'user_lon' not in st.session_state:
     st.session_state['user_lon'] = DEFAULT_LON
 if 'user_address' not in st.session_state:
     st.session_state['user_address'] = ''
+if 'section_timings' not in st.session_state:
+    st.session_state['section_timings'] = {}
+
+
+def record_timing(name: str, seconds: float):
+    """Remember the last render cost of a page section (shown in the timing panel)."""
+    timing = st.session_state['section_timings'].setdefault(name, {"runs": 0, "last_ms": 0.0, "total_ms": 0.0})
+    timing["runs"] += 1
+    timing["last_ms"] = seconds * 1000
+    timing["total_ms"] += seconds * 1000
+
+
+def timed_section(name: str):
+    """Measure every (re)run of a section, including fragment-only reruns."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_timing(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def reverse_geocode(lat: float, lon: float):
+    """Address of a point (cached: Nominatim is slow and rate-limited)."""
+    try:
+        from geopy.geocoders import Nominatim
+        geolocator = Nominatim(user_agent="eat_chill_planner")
+        loc = geolocator.reverse((lat, lon), language='vi')
+        return loc.address if loc else None
+    except Exception:
+        return None
 
 # --- Sidebar (Giữ nguyên) ---
 with st.sidebar:
@@ -47,15 +85,9 @@ with st.sidebar:
     if location_option == "Vị trí hiện tại":
         st.session_state['user_lat'] = st.session_state.get('user_lat', DEFAULT_LAT)
         st.session_state['user_lon'] = st.session_state.get('user_lon', DEFAULT_LON)
-        # (Phần code geocoding... giữ nguyên)
-        try:
-            from geopy.geocoders import Nominatim
-            geolocator = Nominatim(user_agent="eat_chill_planner")
-            loc = geolocator.reverse((st.session_state['user_lat'], st.session_state['user_lon']), language='vi')
-            if loc and loc.address:
-                st.session_state['user_address'] = loc.address
-        except Exception:
-            pass
+        address = reverse_geocode(st.session_state['user_lat'], st.session_state['user_lon'])
+        if address:
+            st.session_state['user_address'] = address
         addr = st.session_state.get('user_address')
         if addr:
             st.info(f"📌 Vị trí: {addr}")
@@ -129,6 +161,9 @@ with st.sidebar:
     radius = st.slider("📍 Bán kính tìm kiếm (km):", 1, 50, 5)
     btn_search = st.button("🔍 Tìm kiếm", use_container_width=True)
 
+    st.divider()
+    show_timings = st.toggle("⏱️ Thời gian render từng phần", value=False)
+
 # --- Main Content: Search Execution (Giữ nguyên) ---
 if btn_search:
     # Build query
@@ -170,9 +205,13 @@ if btn_search:
 st.markdown("---")
 
 # --- BỐ CỤC MỚI: Tách 2 cột trên cùng ---
-top_col1, top_col2 = st.columns([1, 1])
+# Mỗi phần là 1 fragment: tương tác trong phần nào chỉ chạy lại phần đó
+# (vd: gửi tin nhắn chat không vẽ lại bản đồ / không gọi lại API lịch trình).
+# Phần nào cần cập nhật phần khác (thêm vào lịch -> bản đồ) thì gọi st.rerun() cho cả trang.
 
-with top_col1:
+@st.fragment
+@timed_section("Danh sách quán")
+def search_list_section():
     # --- PHẦN 1: Danh sách quán đề xuất ---
     st.subheader("🌟 Danh sách quán đề xuất")
     if 'search_results' in st.session_state and st.session_state['search_results']:
@@ -195,7 +234,10 @@ with top_col1:
     else:
         st.info("Nhấn 'Tìm kiếm' ở cột bên trái để thấy kết quả.")
 
-with top_col2:
+
+@st.fragment
+@timed_section("Form lịch trình")
+def itinerary_form_section():
     # --- PHẦN 2: Lịch trình (Form thêm) ---
     st.subheader("📅 Thêm vào lịch trình")
     
@@ -217,153 +259,216 @@ with top_col2:
         
         sub_btn = st.form_submit_button("Thêm vào lịch")
         
-        if sub_btn and selected_place_data:
-            if 'location' in selected_place_data and 'coordinates' in selected_place_data['location']:
-                coords = selected_place_data['location']['coordinates']
-                lat, lon = coords[1], coords[0]
+    if sub_btn and selected_place_data:
+        if 'location' in selected_place_data and 'coordinates' in selected_place_data['location']:
+            coords = selected_place_data['location']['coordinates']
+            lat, lon = coords[1], coords[0]
+        else:
+            lat = selected_place_data.get('lat', selected_place_data.get('latitude'))
+            lon = selected_place_data.get('lon', selected_place_data.get('longitude'))
+        
+        payload = {
+            "name": act_name, "place_name": selected_place_data['name'],
+            "start_time": str(t_start)[:5], "end_time": str(t_end)[:5],
+            "lat": lat, "lon": lon
+        }
+        
+        try:
+            res = requests.post(f"{BACKEND_URL}/api/itinerary", json=payload)
+        except Exception:
+            st.error("Lỗi kết nối Server")
+            return
+        if res.json().get("status") == "success":
+            st.success("Đã thêm!")
+            st.rerun() # Tải lại cả trang để cập nhật bản đồ
+        else:
+            st.error(res.json().get("message"))
+
+
+@st.fragment
+@timed_section("Bản đồ + lịch trình")
+def itinerary_section():
+    # --- PHẦN 3: Lộ trình di chuyển (Bản đồ OSRM) ---
+    st.subheader("🗺️ Lộ trình di chuyển (OSRM Routing)")
+    try:
+        import folium
+        from streamlit_folium import st_folium
+
+        user_lat_map = st.session_state.get('user_lat', DEFAULT_LAT)
+        user_lon_map = st.session_state.get('user_lon', DEFAULT_LON)
+
+        # Backend giữ sẵn các đoạn đường (legs), chỉ tính lại đoạn nào thay đổi.
+        # Gửi kèm ETag lần trước: lịch trình không đổi thì backend trả 304 (không tải lại)
+        iti_params = {"origin_lat": user_lat_map, "origin_lon": user_lon_map}
+        cached = st.session_state.get('itinerary_cache')
+        headers = {"If-None-Match": cached["etag"]} if cached and cached["params"] == iti_params else {}
+        res_iti = requests.get(f"{BACKEND_URL}/api/itinerary", params=iti_params, headers=headers, timeout=30)
+        if res_iti.status_code == 304:
+            iti_data = cached["data"]
+        else:
+            iti_data = res_iti.json()
+            if res_iti.headers.get("ETag"):
+                st.session_state['itinerary_cache'] = {"etag": res_iti.headers["ETag"], "params": iti_params,
+                                                       "data": iti_data}
             else:
-                lat = selected_place_data.get('lat', selected_place_data.get('latitude'))
-                lon = selected_place_data.get('lon', selected_place_data.get('longitude'))
+                # Không có ETag (đang có đoạn đường tạm do OSRM lỗi): lần sau tải lại đầy đủ
+                st.session_state.pop('itinerary_cache', None)
+        items_map = iti_data.get("itinerary", [])
+        route_segments_map = iti_data.get("legs", [])
+
+        m = folium.Map(location=[user_lat_map, user_lon_map], zoom_start=14)
+        folium.Marker([user_lat_map, user_lon_map], icon=folium.Icon(color="red", icon="home"), popup="🏠 Xuất phát").add_to(m)
+
+        total_distance_osrm = sum(leg.get("distance_km", 0) for leg in route_segments_map)
+        total_duration = sum(leg.get("duration_seconds", 0) for leg in route_segments_map)
+
+        if items_map:
+            colors = ["blue", "green", "purple", "orange", "darkred"]
+            for idx, segment in enumerate(route_segments_map):
+                if "route" in segment and segment["route"]:
+                    color = colors[idx % len(colors)]
+                    folium.PolyLine(segment["route"], color=color, weight=3, opacity=0.8).add_to(m)
+
+            for i, item in enumerate(items_map):
+                folium.Marker([item['lat'], item['lon']], popup=f"<b>{item['start_time']}-{item['end_time']}</b><br>{item['name']}<br>{item['place_name']}", icon=folium.Icon(color="blue", icon=str(i+1), prefix='fa')).add_to(m)
+            
+        st_folium(m, width=None, height=450, returned_objects=[])
+
+    except Exception as e:
+        items_map, route_segments_map = [], []
+        total_distance_osrm = total_duration = 0
+        st.error(f"Chưa tải được bản đồ: {e}")
+
+    st.markdown("---")
+
+    # --- PHẦN 4: Kết quả lịch trình (Text Summary) ---
+    st.subheader("📝 Kết quả lịch trình của bạn")
+    try:
+        # Dùng lại dữ liệu lịch trình + legs đã tải ở phần bản đồ
+        items_summary = items_map
+        
+        if items_summary:
+            st.markdown(f"**📊 Tổng quãng đường OSRM:** {total_distance_osrm:.2f} km | **Thời gian:** {int(total_duration/60)} phút")
             
-            payload = {
-                "name": act_name, "place_name": selected_place_data['name'],
-                "start_time": str(t_start)[:5], "end_time": str(t_end)[:5],
-                "lat": lat, "lon": lon
-            }
+            for i, item in enumerate(items_summary):
+                # Lấy thông tin quãng đường từ bản đồ (nếu có)
+                if i < len(route_segments_map):
+                    segment_data = route_segments_map[i]
+                    segment_dist = segment_data.get("distance_km", "?")
+                    segment_time = int(segment_data.get("duration_seconds", 0) / 60)
+                else:
+                    segment_dist = "?"
+                    segment_time = "?"
+
+                row_text, row_btn = st.columns([10, 1])
+                row_text.markdown(f"**{i+1}. [{item['start_time']}-{item['end_time']}]** {item['name']}\n"
+                                  f"- 📍 {item['place_name']}\n"
+                                  f"- 🚗 Tuyến đường: {segment_dist} km | ⏱️ {segment_time} phút (OSRM)")
+                if row_btn.button("🗑️", key=f"del_item_{item['id']}", help="Xóa khỏi lịch trình"):
+                    requests.delete(f"{BACKEND_URL}/api/itinerary/{item['id']}", timeout=30)
+                    st.rerun(scope="fragment")  # Chỉ vẽ lại bản đồ + tóm tắt
+        else:
+            st.info("Chưa có lịch trình. Thêm địa điểm vào lịch để vẽ tuyến.")
+    except Exception as e:
+        st.error(f"Lỗi tải tóm tắt lịch trình: {e}")
+
+
+@st.fragment
+@timed_section("Chat")
+def chat_section():
+    # --- PHẦN 5: CHATBOT (Dưới dạng expander) ---
+    with st.expander("🤖 Chat với AI (Click để mở)"):
+        # Lưu lịch sử chat
+        if "messages" not in st.session_state:
+            st.session_state.messages = []
+        if "chat_session_id" not in st.session_state:
+            import uuid
+            st.session_state["chat_session_id"] = uuid.uuid4().hex
+
+        # Hiển thị lịch sử
+        for msg in st.session_state.messages:
+            with st.chat_message(msg["role"]):
+                st.write(msg["content"])
+
+        # Ô nhập liệu
+        if prompt := st.chat_input("Hỏi gì đi (vd: Tìm quán cafe):"):
+            # Hiện câu hỏi user
+            st.session_state.messages.append({"role": "user", "content": prompt})
+            with st.chat_message("user"):
+                st.write(prompt)
             
+            # Gọi Chatbot dạng stream: hiện ngay "đã nhận", tiến độ sinh token, rồi từng dòng trả lời
+            ai_reply = ""
+            assistant_box = st.chat_message("assistant")
+            status_slot = assistant_box.empty()
+            reply_slot = assistant_box.empty()
             try:
-                res = requests.post(f"{BACKEND_URL}/api/itinerary", json=payload)
-                if res.json().get("status") == "success":
-                    st.success("Đã thêm!")
-                    st.rerun() # Tải lại để cập nhật bản đồ
+                from chatbot.bot_engine import stream_chat
+                n_tokens = 0
+                for event in stream_chat(prompt, session_id=st.session_state["chat_session_id"]):
+                    if event["type"] == "ack":
+                        status_slot.caption(f"⏳ {event['text']}")
+                    elif event["type"] == "token":
+                        n_tokens += 1
+                        status_slot.caption(f"🧠 Bot đang phân tích câu hỏi... ({n_tokens} token)")
+                    elif event["type"] == "places":
+                        status_slot.caption(f"📍 Backend trả về {len(event['places'])} địa điểm")
+                    elif event["type"] == "text":
+                        ai_reply += event["text"]
+                        reply_slot.markdown(ai_reply)
+                    elif event["type"] == "done":
+                        t = event["timings"]
+                        first = t.get("first_text_ms", t["total_ms"])
+                        status_slot.caption(f"⏱️ Chữ đầu tiên sau {first:.0f} ms, xong sau {t['total_ms']:.0f} ms")
+            except ImportError as ie:
+                ai_reply = f"❌ Lỗi import: {str(ie)[:100]}\n\nKiểm tra:\n- File `chatbot/bot_engine.py` có tồn tại?\n- Chạy: `pip install ollama requests`"
+            except ModuleNotFoundError as me:
+                ai_reply = f"❌ Module không tìm thấy: {str(me)[:100]}"
+            except Exception as e:
+                error_msg = str(e)
+                if "Connection" in error_msg or "connect" in error_msg.lower():
+                    ai_reply = f"❌ Lỗi kết nối Ollama:\n\n{error_msg[:200]}\n\nHướng dẫn:\n1. Mở Ollama (ứng dụng desktop)\n2. Chạy: `ollama run llama3`\n3. Thử chat lại"
                 else:
-                    st.error(res.json().get("message"))
-            except:
-                st.error("Lỗi kết nối Server")
+                    ai_reply = f"❌ Lỗi: {error_msg[:150]}"
 
-st.markdown("---")
+            # Lưu câu trả lời AI (đã hiện dần ở trên; lỗi thì hiện thay cho phần đang dở)
+            st.session_state.messages.append({"role": "assistant", "content": ai_reply})
+            reply_slot.write(ai_reply)
 
-# --- PHẦN 3: Lộ trình di chuyển (Bản đồ OSRM) ---
-st.subheader("🗺️ Lộ trình di chuyển (OSRM Routing)")
-try:
-    res_iti_map = requests.get(f"{BACKEND_URL}/api/itinerary")
-    items_map = res_iti_map.json().get("itinerary", [])
-    
-    user_lat_map = st.session_state.get('user_lat', DEFAULT_LAT)
-    user_lon_map = st.session_state.get('user_lon', DEFAULT_LON)
-    m = folium.Map(location=[user_lat_map, user_lon_map], zoom_start=14)
-    folium.Marker([user_lat_map, user_lon_map], icon=folium.Icon(color="red", icon="home"), popup="🏠 Xuất phát").add_to(m)
+        # Tình trạng hàng đợi LLM (dùng chung cho mọi phiên chat trên server Streamlit này)
+        try:
+            from chatbot.scheduler import llm_scheduler
+            q = llm_scheduler.metrics()
+            st.caption(f"⏳ Hàng đợi AI: {q['queue_depth']} đang chờ | {q['in_flight']}/{q['slots']} đang xử lý | "
+                       f"chờ p50 {q['wait_ms_p50']:.0f} ms, p95 {q['wait_ms_p95']:.0f} ms")
+        except ImportError:
+            pass
 
-    total_distance_osrm = 0
-    total_duration = 0
-    route_segments_map = [] # Dùng để tính toán
 
-    if items_map:
-        all_points = [[user_lat_map, user_lon_map]]
-        for item in items_map:
-            all_points.append([item['lat'], item['lon']])
+@st.fragment(run_every=2)
+def timing_panel():
+    # Tự làm mới mỗi 2s để thấy cả các lần chỉ chạy lại 1 fragment
+    # Bảng markdown thay vì st.dataframe để không phải import pandas/pyarrow
+    rows = ["| Phần | Lần chạy | Lần cuối | Trung bình |", "|---|---:|---:|---:|"]
+    for name, t in st.session_state['section_timings'].items():
+        rows.append(f"| {name} | {t['runs']} | {t['last_ms']:.0f} ms | {t['total_ms'] / t['runs']:.0f} ms |")
+    st.markdown("\n".join(rows))
 
-        for i in range(len(all_points) - 1):
-            try:
-                route_payload = {
-                    "start_lat": all_points[i][0], "start_lon": all_points[i][1],
-                    "end_lat": all_points[i+1][0], "end_lon": all_points[i+1][1]
-                }
-                route_res = requests.post(f"{BACKEND_URL}/api/route", json=route_payload, timeout=10)
-                route_data = route_res.json()
-                route_segments_map.append(route_data)
-
-                if "distance_km" in route_data:
-                    total_distance_osrm += route_data.get("distance_km", 0)
-                    total_duration += route_data.get("duration_seconds", 0)
-            except Exception:
-                route_segments_map.append({"route": [all_points[i], all_points[i+1]]})
-
-        colors = ["blue", "green", "purple", "orange", "darkred"]
-        for idx, segment in enumerate(route_segments_map):
-            if "route" in segment and segment["route"]:
-                color = colors[idx % len(colors)]
-                folium.PolyLine(segment["route"], color=color, weight=3, opacity=0.8).add_to(m)
-
-        for i, item in enumerate(items_map):
-            folium.Marker([item['lat'], item['lon']], popup=f"<b>{item['start_time']}-{item['end_time']}</b><br>{item['name']}<br>{item['place_name']}", icon=folium.Icon(color="blue", icon=str(i+1), prefix='fa')).add_to(m)
-        
-    st_folium(m, width=None, height=450, returned_objects=[])
 
-except Exception as e:
-    st.error(f"Chưa tải được bản đồ: {e}")
+top_col1, top_col2 = st.columns([1, 1])
+with top_col1:
+    search_list_section()
+with top_col2:
+    itinerary_form_section()
 
 st.markdown("---")
-
-# --- PHẦN 4: Kết quả lịch trình (Text Summary) ---
-st.subheader("📝 Kết quả lịch trình của bạn")
-try:
-    # Gọi lại API hoặc dùng biến đã có (nếu cấu trúc phức tạp hơn)
-    # Tạm thời gọi lại để đảm bảo tính độc lập của module
-    res_iti_summary = requests.get(f"{BACKEND_URL}/api/itinerary")
-    items_summary = res_iti_summary.json().get("itinerary", [])
-    
-    if items_summary:
-        # Tính toán lại tổng quãng đường cho phần text (hoặc lấy từ session_state nếu có)
-        # (Để đơn giản, code này chỉ hiển thị danh sách)
-        
-        st.markdown(f"**📊 Tổng quãng đường OSRM:** {total_distance_osrm:.2f} km | **Thời gian:** {int(total_duration/60)} phút")
-        
-        for i, item in enumerate(items_summary):
-            # Lấy thông tin quãng đường từ bản đồ (nếu có)
-            if i < len(route_segments_map):
-                segment_data = route_segments_map[i]
-                segment_dist = segment_data.get("distance_km", "?")
-                segment_time = int(segment_data.get("duration_seconds", 0) / 60)
-            else:
-                segment_dist = "?"
-                segment_time = "?"
-
-            st.markdown(f"**{i+1}. [{item['start_time']}-{item['end_time']}]** {item['name']}\n"
-                        f"- 📍 {item['place_name']}\n"
-                        f"- 🚗 Tuyến đường: {segment_dist} km | ⏱️ {segment_time} phút (OSRM)")
-    else:
-        st.info("Chưa có lịch trình. Thêm địa điểm vào lịch để vẽ tuyến.")
-except Exception as e:
-    st.error(f"Lỗi tải tóm tắt lịch trình: {e}")
+itinerary_section()
 
 st.markdown("---")
+chat_section()
 
-# --- PHẦN 5: CHATBOT (Dưới dạng expander) ---
-with st.expander("🤖 Chat với AI (Click để mở)"):
-    # Lưu lịch sử chat
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-
-    # Hiển thị lịch sử
-    for msg in st.session_state.messages:
-        with st.chat_message(msg["role"]):
-            st.write(msg["content"])
-
-    # Ô nhập liệu
-    if prompt := st.chat_input("Hỏi gì đi (vd: Tìm quán cafe):"):
-        # Hiện câu hỏi user
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.write(prompt)
-        
-        # Gọi hàm xử lý Chatbot
-        try:
-            from chatbot.bot_engine import chat_with_ollama
-            with st.spinner("Bot đang suy nghĩ..."):
-                ai_reply = chat_with_ollama(prompt)
-        except ImportError as ie:
-            ai_reply = f"❌ Lỗi import: {str(ie)[:100]}\n\nKiểm tra:\n- File `chatbot/bot_engine.py` có tồn tại?\n- Chạy: `pip install ollama requests`"
-        except ModuleNotFoundError as me:
-            ai_reply = f"❌ Module không tìm thấy: {str(me)[:100]}"
-        except Exception as e:
-            error_msg = str(e)
-            if "Connection" in error_msg or "connect" in error_msg.lower():
-                ai_reply = f"❌ Lỗi kết nối Ollama:\n\n{error_msg[:200]}\n\nHướng dẫn:\n1. Mở Ollama (ứng dụng desktop)\n2. Chạy: `ollama run llama3`\n3. Thử chat lại"
-            else:
-                ai_reply = f"❌ Lỗi: {error_msg[:150]}"
-
-        # Hiện câu trả lời AI
-        st.session_state.messages.append({"role": "assistant", "content": ai_reply})
-        with st.chat_message("assistant"):
-            st.write(ai_reply)
\ No newline at end of file
+record_timing("Toàn trang (chạy lại cả script)", time.perf_counter() - page_started)
+if show_timings:
+    with st.sidebar:
+        st.caption("⏱️ Thời gian render (ms)")
+        timing_panel()
\ No newline at end of file
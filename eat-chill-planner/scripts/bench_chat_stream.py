@@ -0,0 +1,65 @@
+# File: scripts/bench_chat_stream.py
+# Đo thời gian tới phản hồi đầu tiên của chatbot: stream_chat (từng sự kiện) so với chat_with_ollama (chờ hết)
+#
+# Cần backend đang chạy (uvicorn backend.main:app) hoặc dùng --standins-backend để bỏ qua phần tìm quán.
+# Chạy từ thư mục gốc:
+#   python scripts/bench_chat_stream.py --runs 5 --token-latency 0.05
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from upstream_standins import Standins
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first event: streamed vs blocking chat replies")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2, help="stand-in Ollama latency before the first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.05, help="stand-in Ollama delay per token (s)")
+    parser.add_argument("--message", default="Tìm quán phở gần đây")
+    args = parser.parse_args()
+
+    standins = Standins(ollama_latency=args.latency, ollama_token_latency=args.token_latency).start()
+    os.environ.update(standins.env())
+
+    from chatbot.bot_engine import chat_with_ollama, stream_chat
+
+    blocking, first_event, first_token, first_text, total = [], [], [], [], []
+    for i in range(args.runs):
+        started = time.perf_counter()
+        reply = chat_with_ollama(args.message, session_id=f"bench-blocking-{i}")
+        blocking.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        streamed = ""
+        for event in stream_chat(args.message, session_id=f"bench-stream-{i}"):
+            if event["type"] == "ack":
+                first_event.append((time.perf_counter() - started) * 1000)
+            elif event["type"] == "text":
+                streamed += event["text"]
+            elif event["type"] == "done":
+                timings = event["timings"]
+                first_token.append(timings.get("first_token_ms", float("nan")))
+                first_text.append(timings.get("first_text_ms", float("nan")))
+                total.append(timings["total_ms"])
+        if streamed != reply:
+            print(f"run {i}: streamed reply differs from blocking reply")
+    standins.stop()
+
+    print(f"{args.runs} runs, Ollama stand-in: {args.latency}s + {args.token_latency}s/token")
+    for label, values in (("blocking reply", blocking), ("stream: ack", first_event),
+                          ("stream: 1st token", first_token), ("stream: 1st text", first_text),
+                          ("stream: done", total)):
+        print(f"  {label:<18} p50 {statistics.median(values):8.1f} ms")
+    print(f"\nLast reply:\n{reply}")
+
+
+if __name__ == "__main__":
+    main()
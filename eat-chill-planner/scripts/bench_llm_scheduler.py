@@ -0,0 +1,105 @@
+# File: scripts/bench_llm_scheduler.py
+# Thử hàng đợi LLM (chatbot/scheduler.py) với Ollama giả lập có độ trễ
+#
+# Chạy từ thư mục gốc:
+#   python scripts/bench_llm_scheduler.py --sessions 12 --slots 1 --ollama-parallel 1 --latency 0.5
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from upstream_standins import Standins
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM scheduler against a stand-in Ollama")
+    parser.add_argument("--sessions", type=int, default=12, help="concurrent chat sessions")
+    parser.add_argument("--slots", type=int, default=1, help="scheduler slots")
+    parser.add_argument("--deadline", type=float, default=5.0, help="per-request deadline (s)")
+    parser.add_argument("--ollama-parallel", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.5, help="stand-in Ollama latency per request (s)")
+    parser.add_argument("--resend-every", type=int, default=3,
+                        help="every Nth session sends a second message right away (cancels the first)")
+    args = parser.parse_args()
+
+    standins = Standins(ollama_latency=args.latency, ollama_token_latency=0.0,
+                        ollama_parallel=args.ollama_parallel).start()
+    os.environ.update(standins.env())
+
+    import ollama
+    from chatbot.scheduler import LLMScheduler, RequestCancelled, SchedulerTimeout
+
+    scheduler = LLMScheduler(slots=args.slots, deadline_seconds=args.deadline)
+    outcomes, latencies = [], []
+    lock = threading.Lock()
+
+    def ask(session_id: str, message: str):
+        start = time.perf_counter()
+        try:
+            with scheduler.slot(session_id) as ticket:
+                ollama.chat(model="llama3.2:1b", messages=[{"role": "user", "content": message}])
+                ticket.raise_if_stale()
+            outcome = "ok"
+        except RequestCancelled:
+            outcome = "cancelled"
+        except SchedulerTimeout:
+            outcome = "timed_out"
+        except Exception as e:
+            outcome = f"error: {e}"
+        with lock:
+            outcomes.append(outcome)
+            if outcome == "ok":
+                latencies.append(time.perf_counter() - start)
+
+    def session(i: int):
+        session_id = f"session-{i}"
+        if args.resend_every and i % args.resend_every == 0:
+            first = threading.Thread(target=ask, args=(session_id, "Tìm quán phở"))
+            first.start()
+            time.sleep(0.05)
+            ask(session_id, "À thôi, tìm quán lẩu")
+            first.join()
+        else:
+            ask(session_id, "Tìm quán cafe")
+
+    stop = threading.Event()
+
+    def monitor():
+        while not stop.is_set():
+            m = scheduler.metrics()
+            print(f"  queue={m['queue_depth']:>2} in_flight={m['in_flight']}/{m['slots']} "
+                  f"completed={m['completed']} cancelled={m['cancelled']} timed_out={m['timed_out']}")
+            stop.wait(0.5)
+
+    print(f"{args.sessions} sessions, {args.slots} slot(s), deadline {args.deadline}s, "
+          f"Ollama stand-in: {args.latency}s/request, parallel={args.ollama_parallel}")
+    watcher = threading.Thread(target=monitor, daemon=True)
+    watcher.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    watcher.join()
+    standins.stop()
+
+    print(f"\nDone in {elapsed:.2f}s")
+    for outcome in sorted(set(outcomes)):
+        print(f"  {outcome:<10} {outcomes.count(outcome)}")
+    if latencies:
+        print(f"  latency ok: p50 {statistics.median(latencies) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms")
+    print(f"  scheduler metrics: {scheduler.metrics()}")
+
+
+if __name__ == "__main__":
+    main()
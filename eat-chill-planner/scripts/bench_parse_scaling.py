@@ -0,0 +1,72 @@
+# File: scripts/bench_parse_scaling.py
+# Đo throughput parse payload Overpass lớn khi tăng số process (scaling theo số core)
+#
+# Chạy từ thư mục gốc:  python scripts/bench_parse_scaling.py --elements 5000 --jobs 64
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from backend.osm_search import parse_overpass_places
+
+ORIGIN = (10.762622, 106.660172)
+
+
+def make_payload(n_elements: int) -> str:
+    """Synthetic Overpass response with n nodes scattered around Quận 10."""
+    rnd = random.Random(42)
+    elements = []
+    for i in range(n_elements):
+        elements.append({
+            "type": "node",
+            "id": i,
+            "lat": ORIGIN[0] + rnd.uniform(-0.05, 0.05),
+            "lon": ORIGIN[1] + rnd.uniform(-0.05, 0.05),
+            "tags": {"amenity": "restaurant", "name": f"Quán {i}", "rating": str(rnd.randint(1, 5))},
+        })
+    return json.dumps({"elements": elements})
+
+
+def run(executor_cls, workers: int, payload: str, jobs: int, limit: int) -> float:
+    with executor_cls(max_workers=workers) as pool:
+        # Warm-up: khởi động process trước khi đo
+        list(pool.map(parse_overpass_places, [payload] * workers, [ORIGIN[0]] * workers,
+                      [ORIGIN[1]] * workers, [10] * workers, [limit] * workers))
+        start = time.perf_counter()
+        list(pool.map(parse_overpass_places, [payload] * jobs, [ORIGIN[0]] * jobs,
+                      [ORIGIN[1]] * jobs, [10] * jobs, [limit] * jobs))
+        return jobs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overpass parse scaling benchmark")
+    parser.add_argument("--elements", type=int, default=5000)
+    parser.add_argument("--jobs", type=int, default=64)
+    args = parser.parse_args()
+
+    payload = make_payload(args.elements)
+    limit = args.elements
+    cores = os.cpu_count() or 1
+    print(f"Payload: {args.elements} elements ({len(payload) / 1024:.0f} KB), {args.jobs} jobs, {cores} cores")
+
+    baseline = run(ThreadPoolExecutor, 1, payload, args.jobs, limit)
+    print(f"{'threads x1':>12}: {baseline:7.2f} jobs/s (1.00x)")
+    threaded = run(ThreadPoolExecutor, cores, payload, args.jobs, limit)
+    print(f"{f'threads x{cores}':>12}: {threaded:7.2f} jobs/s ({threaded / baseline:.2f}x)")
+
+    workers = 1
+    while workers <= cores:
+        rate = run(ProcessPoolExecutor, workers, payload, args.jobs, limit)
+        print(f"{f'processes x{workers}':>12}: {rate:7.2f} jobs/s ({rate / baseline:.2f}x)")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
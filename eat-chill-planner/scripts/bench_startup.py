@@ -0,0 +1,152 @@
+# File: scripts/bench_startup.py
+# Đo thời gian import + độ trễ request đầu tiên, và kiểm tra không bị chậm lại (regression check)
+#
+# Chạy từ thư mục gốc:
+#   python scripts/bench_startup.py                    # in kết quả, exit 1 nếu vượt ngưỡng
+#   python scripts/bench_startup.py --ollama-cold-start 3 --max-first-chat-ms 1500
+
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from upstream_standins import Standins
+
+# Module nặng không được import sẵn lúc khởi động (chỉ import khi dùng tới)
+LAZY_MODULES = {
+    "chatbot.bot_engine": ["ollama", "httpx"],
+}
+FRONTEND_LAZY_IMPORTS = {"pandas", "folium", "streamlit_folium"}
+
+
+def measure_import(module: str, runs: int) -> float:
+    """Median import time (ms) of ``module`` in a fresh interpreter."""
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=project_root, capture_output=True, text=True,
+                             env={**os.environ, "EAT_CHILL_WARMUP": "0"}, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def eagerly_imported(module: str, lazy: list) -> list:
+    """Heavy modules that got imported as a side effect of importing ``module``."""
+    code = f"import sys, {module}; print(','.join(m for m in {lazy!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=project_root, capture_output=True, text=True, check=True)
+    return [m for m in out.stdout.strip().split(",") if m]
+
+
+def frontend_top_level_imports() -> set:
+    """Top-level imports of frontend/app.py (imports inside blocks run only when needed)."""
+    tree = ast.parse((project_root / "frontend" / "app.py").read_text(encoding="utf-8"))
+    names = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.add(node.module.split(".")[0])
+    return names
+
+
+def measure_first_requests(standins: Standins, port: int, warm_up: bool, think_time: float) -> dict:
+    """Start a fresh backend and time its first /api/search and first chat turn."""
+    env = {**os.environ, **standins.env(), "EAT_CHILL_WARMUP": "1" if warm_up else "0"}
+    started = time.perf_counter()
+    backend = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+                                "--log-level", "warning"], cwd=project_root, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        while True:
+            try:
+                requests.get(base_url, timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.05)
+        ready = time.perf_counter() - started
+
+        # Người dùng thường mất vài giây mới gửi tin nhắn đầu tiên
+        time.sleep(think_time)
+        t = time.perf_counter()
+        requests.post(f"{base_url}/api/search", json={"lat": 10.762622, "lon": 106.660172, "category": "Ăn uống"},
+                      timeout=60)
+        first_search = time.perf_counter() - t
+
+        code = ("import time; from chatbot.bot_engine import chat_with_ollama; t = time.perf_counter(); "
+                "chat_with_ollama('Tìm quán phở'); print((time.perf_counter() - t) * 1000)")
+        chat_env = {**env, "EAT_CHILL_BACKEND_URL": base_url}
+        out = subprocess.run([sys.executable, "-c", code], cwd=project_root, capture_output=True, text=True,
+                             env=chat_env, check=True)
+        first_chat = float(out.stdout.strip().splitlines()[-1])
+        return {"ready_ms": ready * 1000, "first_search_ms": first_search * 1000, "first_chat_ms": first_chat}
+    finally:
+        backend.terminate()
+        backend.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark + regression check")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--ollama-cold-start", type=float, default=2.0, help="simulated model load time (s)")
+    parser.add_argument("--think-time", type=float, default=3.0, help="seconds before the first request")
+    parser.add_argument("--max-import-ms", type=float, default=1500, help="budget per module import")
+    parser.add_argument("--max-first-chat-ms", type=float, default=1500, help="budget for the first chat turn")
+    args = parser.parse_args()
+
+    failures = []
+
+    print("=== Import time (median, fresh interpreter) ===")
+    for module in ("chatbot.bot_engine", "backend.main"):
+        ms = measure_import(module, args.runs)
+        print(f"{module:<22} {ms:8.1f} ms")
+        if ms > args.max_import_ms:
+            failures.append(f"import {module} took {ms:.0f} ms (budget {args.max_import_ms:.0f} ms)")
+
+    print("\n=== Lazy imports ===")
+    for module, lazy in LAZY_MODULES.items():
+        eager = eagerly_imported(module, lazy)
+        print(f"{module:<22} eager: {', '.join(eager) or '-'}")
+        if eager:
+            failures.append(f"{module} imports {', '.join(eager)} at module load")
+    eager_frontend = frontend_top_level_imports() & FRONTEND_LAZY_IMPORTS
+    print(f"{'frontend/app.py':<22} eager: {', '.join(sorted(eager_frontend)) or '-'}")
+    if eager_frontend:
+        failures.append(f"frontend/app.py imports {', '.join(sorted(eager_frontend))} at top level")
+
+    print(f"\n=== First requests (simulated Ollama model load: {args.ollama_cold_start:.1f}s) ===")
+    results = {}
+    for warm_up in (False, True):
+        standins = Standins(overpass_latency=0.3, ollama_cold_start=args.ollama_cold_start).start()
+        try:
+            results[warm_up] = measure_first_requests(standins, args.port, warm_up, args.think_time)
+        finally:
+            standins.stop()
+        r = results[warm_up]
+        label = "with warm-up" if warm_up else "no warm-up"
+        print(f"{label:<14} ready {r['ready_ms']:7.0f} ms | first search {r['first_search_ms']:7.0f} ms | "
+              f"first chat {r['first_chat_ms']:7.0f} ms")
+    if results[True]["first_chat_ms"] > args.max_first_chat_ms:
+        failures.append(f"first chat took {results[True]['first_chat_ms']:.0f} ms with warm-up "
+                        f"(budget {args.max_first_chat_ms:.0f} ms)")
+
+    if failures:
+        print("\nREGRESSION:")
+        for failure in failures:
+            print(f"- {failure}")
+        sys.exit(1)
+    print("\nOK: all startup budgets met.")
+
+
+if __name__ == "__main__":
+    main()
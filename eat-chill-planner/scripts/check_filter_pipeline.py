@@ -0,0 +1,145 @@
+# File: scripts/check_filter_pipeline.py
+# So sánh bộ lọc NumPy (backend/place_filters.py) với matches_*_filters gốc trên dữ liệu ngẫu nhiên
+#
+# Chạy từ thư mục gốc:
+#   python scripts/check_filter_pipeline.py                 # exit 1 nếu có quán lọc khác nhau
+#   python scripts/check_filter_pipeline.py --trials 2000 --bench-size 20000
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from backend.osm_search import matches_food_filters, matches_entertainment_filters
+from backend.place_filters import PlaceBatch, filter_places, rank_by_relevance
+
+AMENITIES = ["restaurant", "fast_food", "cafe", "bar", "pub", "cinema", "theatre", "arts_centre", "karaoke_box",
+             "nightclub", "museum", "gallery", "sports_centre", "gym", "marketplace", "shop", "Restaurant", "CAFE", ""]
+CUISINES = ["vietnamese", "Vietnamese", "korean;japanese", "asian", "thai", "italian", "french", "european",
+            "vegan", "vegetarian", "pizza", "coffee_shop", ""]
+NAME_PARTS = ["Phở", "PHỞ", "Bún bò", "Cơm tấm", "Nhà hàng", "Quán ăn", "Cafe", "Coffee", "Bar", "Buffet",
+              "Quick", "fast_food", "Rạp phim", "Triển lãm", "Karaoke", "Shop", "Lẩu", "Chay", "Tea"]
+PRICES = ["$", "$$", "$$$", "", "cheap", "$ - $$"]
+FILTER_OPTIONS = {
+    "food_type": ["Quán ăn", "Nhà hàng", "Đồ uống", "Cafe", "Ăn vặt", "Bar", "Buffet"],
+    "cuisine": ["Món Việt", "Món Á", "Món Âu", "Chay", "Mon á", "Khác"],
+    "atmosphere": ["Yên tĩnh", "Lãng mạn", "Sôi động"],
+    "activity_type": ["Xem Phim", "Triển lãm", "Thể thao", "Karaoke", "Mua sắm", "Du lịch", "Workshop"],
+}
+PRICE_OPTIONS = ["Thấp", "Trung bình", "Cao", "", None]
+SPACE_OPTIONS = ["Trong nhà", "Ngoài trời", "trong nhà/ngoài trời", "", None]
+
+
+def random_place(rnd: random.Random, i: int) -> dict:
+    tags = {}
+    if rnd.random() < 0.9:
+        tags["amenity"] = rnd.choice(AMENITIES)
+    if rnd.random() < 0.9:
+        tags["name"] = " ".join(rnd.sample(NAME_PARTS, rnd.randint(1, 3))) + f" {i}"
+    if rnd.random() < 0.4:
+        tags["cuisine"] = rnd.choice(CUISINES)
+    if rnd.random() < 0.3:
+        tags["outdoor_seating"] = rnd.choice(["yes", "YES", "no", ""])
+    if rnd.random() < 0.3:
+        tags["price"] = rnd.choice(PRICES)
+    place = {"name": tags.get("name", "Unnamed"), "lat": 10.77, "lon": 106.69, "distance": round(rnd.random() * 5, 2),
+             "rating": rnd.choice([None, 3.5, 4.8]), "place_id": i}
+    roll = rnd.random()
+    if roll < 0.05:
+        place["tags"] = None
+    elif roll > 0.1:  # 0.05-0.1: không có key "tags"
+        place["tags"] = tags
+    return place
+
+
+def random_filters(rnd: random.Random) -> dict:
+    filters = {}
+    for key, options in FILTER_OPTIONS.items():
+        if rnd.random() < 0.5:
+            filters[key] = rnd.sample(options, rnd.randint(0, 3))
+    if rnd.random() < 0.05:
+        filters["cuisine"] = "Chay"  # Chuỗi thay vì list: hàm gốc duyệt từng ký tự, pipeline phải giống vậy
+    if rnd.random() < 0.7:
+        filters["price"] = rnd.choice(PRICE_OPTIONS)
+    if rnd.random() < 0.5:
+        filters["space"] = rnd.choice(SPACE_OPTIONS)
+    return filters
+
+
+def reference(places: list, category: str, filters: dict) -> list:
+    if category == "Ăn uống":
+        return [p for p in places if matches_food_filters(p.get("tags", {}), filters)]
+    if category == "Giải trí":
+        return [p for p in places if matches_entertainment_filters(p.get("tags", {}), filters)]
+    return list(places)
+
+
+def timed(func) -> float:
+    t = time.perf_counter()
+    func()
+    return time.perf_counter() - t
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Differential check: vectorized filters vs matches_*_filters")
+    parser.add_argument("--trials", type=int, default=500)
+    parser.add_argument("--places", type=int, default=200, help="places per trial")
+    parser.add_argument("--bench-size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    mismatches = 0
+    for trial in range(args.trials):
+        places = [random_place(rnd, i) for i in range(rnd.randint(0, args.places))]
+        category = rnd.choice(["Ăn uống", "Giải trí", "", None])
+        filters = random_filters(rnd)
+        expected = [p["place_id"] for p in reference(places, category, filters)]
+        actual = [p["place_id"] for p in filter_places(places, category, filters)]
+        # Cột của lô (PlaceBatch) dùng lại qua 2 lần lọc rồi xếp hạng phải cho cùng kết quả như cột dựng mới
+        batch = PlaceBatch(places)
+        filter_places(batch, category, random_filters(rnd))
+        refiltered = filter_places(filter_places(batch, category, filters), "Ăn uống", {"price": "Thấp"})
+        fresh = filter_places(list(filter_places(places, category, filters)), "Ăn uống", {"price": "Thấp"})
+        keyword = rnd.choice(["phở", "cafe", "", None])
+        reused = [(p["place_id"], p["relevance"]) for p in rank_by_relevance(refiltered, keyword, filters)]
+        rebuilt = [(p["place_id"], p["relevance"]) for p in rank_by_relevance(list(fresh), keyword, filters)]
+        if expected != actual or reused != rebuilt:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"MISMATCH trial {trial}: category={category!r} filters={filters}")
+                print(f"  only reference: {sorted(set(expected) - set(actual))[:10]}")
+                print(f"  only pipeline:  {sorted(set(actual) - set(expected))[:10]}")
+                if reused != rebuilt:
+                    print("  batch columns reused across filter/rank differ from fresh columns")
+    print(f"{args.trials} trials, {mismatches} mismatching")
+
+    places = [random_place(rnd, i) for i in range(args.bench_size)]
+    filters = {"food_type": ["Quán ăn", "Đồ uống"], "cuisine": ["Món Việt", "Chay"], "atmosphere": ["Lãng mạn"],
+               "price": "Thấp"}
+    batch = PlaceBatch(places)
+    filter_places(batch, "Ăn uống", filters)  # Request đầu tiên trên lô dựng các cột
+    # "fresh columns" = chi phí của request đầu tiên trên 1 lô Overpass (dựng cột + lọc),
+    # "batch columns" = các request sau dùng chung lô đó (request gộp, lọc rồi xếp hạng)
+    runs = (
+        ("per-place", lambda: reference(places, "Ăn uống", filters)),
+        ("fresh columns", lambda: filter_places(places, "Ăn uống", filters)),
+        ("batch columns", lambda: filter_places(batch, "Ăn uống", filters)),
+        ("relevance, fresh", lambda: rank_by_relevance(places, "phở", filters, limit=20)),
+        ("filter+relevance, batch", lambda: rank_by_relevance(filter_places(batch, "Ăn uống", filters), "phở",
+                                                              filters, limit=20)),
+    )
+    print(f"\nBenchmark: {len(places)} places, best of {args.repeat}")
+    for label, func in runs:
+        best = min(timed(func) for _ in range(args.repeat))
+        print(f"{label:<24} {best * 1000:8.1f} ms")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
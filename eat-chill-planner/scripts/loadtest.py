@@ -0,0 +1,257 @@
+# File: scripts/loadtest.py
+# Load test: giả lập nhiều người dùng lập lịch cùng lúc, đo throughput + latency từng endpoint
+#
+# Script tự bật server giả lập Overpass/OSRM/Ollama (scripts/upstream_standins.py) và
+# 1 backend uvicorn trỏ vào chúng, rồi tăng dần số phiên chạy song song.
+#
+# Chạy từ thư mục gốc:
+#   python scripts/loadtest.py --levels 1,2,4,8,16,32 --duration 20
+#   python scripts/loadtest.py --workers 4 --store /tmp/eat_chill_load.db   # backend nhiều worker
+
+import argparse
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import requests
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from upstream_standins import Standins
+
+# Một vài điểm xuất phát quanh TP.HCM (để cache Overpass có cả hit lẫn miss)
+ORIGINS = [(10.762622 + dy, 106.660172 + dx) for dy in (-0.02, 0, 0.02) for dx in (-0.02, 0, 0.02)]
+CHAT_MESSAGES = ["Tìm quán phở", "Tìm quán lẩu", "Chào bạn", "Tìm quán cafe", "Tìm quán chay"]
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)  # nearest-rank
+    return ordered[index]
+
+
+class Recorder:
+    """Thread-safe latency/error recorder, keyed by endpoint name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+def timed(recorder: Recorder, endpoint: str, func):
+    start = time.perf_counter()
+    try:
+        result = func()
+        ok = getattr(result, "status_code", 200) < 400
+    except Exception:
+        result, ok = None, False
+    recorder.record(endpoint, time.perf_counter() - start, ok)
+    return result
+
+
+def run_session(base_url: str, recorder: Recorder, rnd: random.Random, http: requests.Session, chat):
+    """One planner session: search -> add item -> fetch itinerary with legs -> chat."""
+    lat, lon = rnd.choice(ORIGINS)
+    category = rnd.choice(["Ăn uống", "Giải trí"])
+    payload = {"lat": lat, "lon": lon, "category": category, "filters": {"category": category}}
+    res = timed(recorder, "POST /api/search", lambda: http.post(f"{base_url}/api/search", json=payload, timeout=60))
+    places = res.json().get("places", []) if res is not None and res.ok else []
+
+    if places:
+        place = rnd.choice(places)
+        hour = rnd.randint(6, 22)
+        item = {"name": category, "place_name": place["name"], "lat": place["lat"], "lon": place["lon"],
+                "start_time": f"{hour:02d}:00", "end_time": f"{hour:02d}:45"}
+        timed(recorder, "POST /api/itinerary", lambda: http.post(f"{base_url}/api/itinerary", json=item, timeout=60))
+
+    def fetch_itinerary():
+        # Giống frontend: lấy lịch trình kèm các đoạn đường (legs) tính từ vị trí của người dùng
+        res = http.get(f"{base_url}/api/itinerary", params={"origin_lat": lat, "origin_lon": lon}, timeout=60)
+        data = res.json()
+        if len(data.get("legs", [])) != len(data.get("itinerary", [])):
+            raise RuntimeError("itinerary returned without a leg per item")
+        return res
+
+    timed(recorder, "GET /api/itinerary (+legs)", fetch_itinerary)
+
+    def chat_turn():
+        reply = chat(rnd.choice(CHAT_MESSAGES))
+        # chat_with_ollama trả lỗi dưới dạng text thay vì raise
+        if reply.startswith(("Lỗi", "Bot đang bị lỗi")):
+            raise RuntimeError(reply)
+        return reply
+
+    timed(recorder, "chat (Ollama + /api/search)", chat_turn)
+
+
+def run_level(base_url: str, concurrency: int, duration: float, chat, seed: int) -> dict:
+    recorder = Recorder()
+    stop_at = time.perf_counter() + duration
+    sessions_done = [0]
+    lock = threading.Lock()
+
+    def worker(worker_id: int):
+        rnd = random.Random(seed * 1000 + worker_id)
+        http = requests.Session()
+        while time.perf_counter() < stop_at:
+            run_session(base_url, recorder, rnd, http, chat)
+            with lock:
+                sessions_done[0] += 1
+
+    requests.post(f"{base_url}/api/itinerary/reset", timeout=30)
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    total = 0
+    for endpoint, values in recorder.latencies.items():
+        total += len(values)
+        endpoints[endpoint] = {
+            "count": len(values),
+            "rps": len(values) / elapsed,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "error_rate": recorder.errors[endpoint] / len(values),
+        }
+    return {"concurrency": concurrency, "elapsed": elapsed, "sessions": sessions_done[0],
+            "rps": total / elapsed, "endpoints": endpoints}
+
+
+def print_level(result: dict, upstream: dict):
+    print(f"\n=== Concurrency {result['concurrency']}: {result['sessions']} sessions, "
+          f"{result['rps']:.1f} req/s ({result['sessions'] / result['elapsed']:.2f} sessions/s) ===")
+    print(f"{'endpoint':<32} {'count':>6} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for endpoint, stats in sorted(result["endpoints"].items()):
+        print(f"{endpoint:<32} {stats['count']:>6} {stats['rps']:>7.1f} {stats['p50'] * 1000:>8.0f} "
+              f"{stats['p95'] * 1000:>8.0f} {stats['p99'] * 1000:>8.0f} {stats['error_rate']:>7.1%}")
+    print("upstream peak in-flight: " + ", ".join(f"{name}={s['peak_in_flight']}" for name, s in upstream.items()))
+
+
+def print_saturation_report(results: list, upstreams: list, workers: int):
+    print("\n=== Saturation report ===")
+    print(f"{'conc':>5} {'sessions/s':>11} {'req/s':>8} {'search p95':>11} {'itin p95':>10} "
+          f"{'overpass':>9} {'osrm':>5} {'ollama':>7}")
+    knee = None
+    for i, (result, upstream) in enumerate(zip(results, upstreams)):
+        sessions_rate = result["sessions"] / result["elapsed"]
+        search_p95 = result["endpoints"].get("POST /api/search", {}).get("p95", 0) * 1000
+        itinerary_p95 = result["endpoints"].get("GET /api/itinerary (+legs)", {}).get("p95", 0) * 1000
+        print(f"{result['concurrency']:>5} {sessions_rate:>11.2f} {result['rps']:>8.1f} {search_p95:>9.0f}ms "
+              f"{itinerary_p95:>8.0f}ms {upstream['overpass']['peak_in_flight']:>9} "
+              f"{upstream['osrm']['peak_in_flight']:>5} {upstream['ollama']['peak_in_flight']:>7}")
+        if i and knee is None:
+            prev = results[i - 1]
+            prev_rate = prev["sessions"] / prev["elapsed"]
+            # Điểm bão hòa: tăng số phiên song song mà throughput tăng < 10%
+            if sessions_rate < prev_rate * 1.10:
+                knee = (prev, result)
+
+    if knee:
+        prev, result = knee
+        growth = {
+            endpoint: stats["p95"] / prev["endpoints"][endpoint]["p95"]
+            for endpoint, stats in result["endpoints"].items()
+            if prev["endpoints"].get(endpoint, {}).get("p95")
+        }
+        worst = max(growth, key=growth.get) if growth else "?"
+        print(f"\nThroughput flattens between concurrency {prev['concurrency']} and {result['concurrency']}; "
+              f"beyond that, latency only queues up (p95 of {worst} grew {growth.get(worst, 0):.1f}x).")
+    else:
+        print("\nNo saturation knee within the tested levels.")
+
+    # Gợi ý nguyên nhân: so sánh số request upstream đồng thời với giới hạn thread pool
+    threadpool_limit = 40 * workers  # anyio mặc định 40 thread cho endpoint sync, mỗi worker
+    peak_upstream = max(u["overpass"]["peak_in_flight"] + u["osrm"]["peak_in_flight"] for u in upstreams)
+    peak_ollama = max(u["ollama"]["peak_in_flight"] for u in upstreams)
+    print(f"Peak backend->upstream concurrency: {peak_upstream} (sync worker threads available: {threadpool_limit}).")
+    if peak_upstream >= threadpool_limit * 0.9:
+        print("-> The worker thread pool is exhausted: requests wait for a free thread before reaching upstreams.")
+    if peak_ollama > 1:
+        print(f"-> Up to {peak_ollama} chat calls queued on Ollama at once; the LLM is a serial bottleneck.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eat & Chill backend load test")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per level")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--store", default="", help="EAT_CHILL_STORE_PATH (required for --workers > 1)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--overpass-latency", type=float, default=0.3)
+    parser.add_argument("--osrm-latency", type=float, default=0.05)
+    parser.add_argument("--ollama-latency", type=float, default=0.2)
+    parser.add_argument("--ollama-parallel", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.workers > 1 and not args.store:
+        parser.error("--workers > 1 needs --store so workers share the itinerary")
+
+    standins = Standins(overpass_latency=args.overpass_latency, osrm_latency=args.osrm_latency,
+                        ollama_latency=args.ollama_latency, ollama_parallel=args.ollama_parallel).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, **standins.env()}
+    if args.store:
+        env["EAT_CHILL_STORE_PATH"] = args.store
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=project_root, env=env,
+    )
+    try:
+        for _ in range(100):
+            try:
+                requests.get(base_url, timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.2)
+
+        # Chatbot chạy trong process này (như Streamlit), trỏ vào backend + Ollama giả lập
+        os.environ.update(standins.env())
+        os.environ["EAT_CHILL_BACKEND_URL"] = base_url
+        from chatbot.bot_engine import chat_with_ollama
+
+        results, upstreams = [], []
+        for concurrency in [int(v) for v in args.levels.split(",")]:
+            standins.reset_peaks()
+            result = run_level(base_url, concurrency, args.duration, chat_with_ollama, args.seed)
+            upstream = standins.snapshot()
+            print_level(result, upstream)
+            results.append(result)
+            upstreams.append(upstream)
+        print_saturation_report(results, upstreams, args.workers)
+        # Số lần gọi upstream tiết kiệm nhờ gộp request (chỉ của worker trả lời request này)
+        coalescing = requests.get(f"{base_url}/api/stats/upstream", timeout=10).json()["upstream"]
+        print("Request coalescing: " + (", ".join(
+            f"{kind} sent={s['upstream_calls']} saved={s['coalesced']}" for kind, s in coalescing.items()) or "-"))
+    finally:
+        backend.terminate()
+        backend.wait(timeout=10)
+        standins.stop()
+
+
+if __name__ == "__main__":
+    main()
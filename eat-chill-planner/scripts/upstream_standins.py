@@ -0,0 +1,308 @@
+# File: scripts/upstream_standins.py
+# Server giả lập Overpass, OSRM và Ollama để load test / đo đạc mà không gọi dịch vụ thật
+#
+# Chạy riêng:  python scripts/upstream_standins.py --overpass-latency 0.3 --osrm-latency 0.05
+# Sau đó trỏ backend/chatbot vào các server này:
+#   EAT_CHILL_OVERPASS_URL=http://127.0.0.1:9101/api/interpreter
+#   EAT_CHILL_OSRM_URL=http://127.0.0.1:9102
+#   OLLAMA_HOST=http://127.0.0.1:9103
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class StandinStats:
+    """Request counters + peak number of requests in flight."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.in_flight -= 1
+
+    def reset_peak(self):
+        with self._lock:
+            self.peak_in_flight = self.in_flight
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "in_flight": self.in_flight, "peak_in_flight": self.peak_in_flight}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "EatChillStandin/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _overpass_handler(latency: float, elements_per_query: int, stats: StandinStats):
+    class OverpassHandler(_Handler):
+        def do_POST(self):
+            with stats:
+                query = self._read_body().decode("utf-8", errors="ignore")
+                time.sleep(latency)
+                # Lấy bbox đầu tiên trong query: (south,west,north,east)
+                try:
+                    bbox = query.split("](", 1)[1].split(")", 1)[0]
+                    south, west, north, east = (float(v) for v in bbox.split(","))
+                except (IndexError, ValueError):
+                    south, west, north, east = 10.72, 106.62, 10.80, 106.70
+                rnd = random.Random(query)
+                amenities = ["restaurant", "cafe", "fast_food", "bar", "cinema", "theatre", "karaoke_box"]
+                names = ["Phở Hòa", "Bún bò Huế", "Cơm tấm", "Lẩu Thái", "Cafe Sữa", "Quán Chay", "Pizza", "CGV", "Karaoke Nice"]
+                elements = []
+                for i in range(elements_per_query):
+                    tags = {"amenity": rnd.choice(amenities), "name": f"{rnd.choice(names)} {i}"}
+                    if rnd.random() < 0.3:
+                        tags["cuisine"] = rnd.choice(["vietnamese", "korean", "italian", "vegetarian"])
+                    if rnd.random() < 0.2:
+                        tags["outdoor_seating"] = "yes"
+                    elements.append({
+                        "type": "node",
+                        "id": rnd.randint(1, 10 ** 9),
+                        "lat": rnd.uniform(south, north),
+                        "lon": rnd.uniform(west, east),
+                        "tags": tags,
+                    })
+                self._send_json({"elements": elements})
+
+    return OverpassHandler
+
+
+def _osrm_handler(latency: float, stats: StandinStats):
+    def coords_from_path(path: str) -> list:
+        raw = path.rstrip("/").split("/")[-1]
+        points = []
+        for pair in raw.split(";"):
+            lon, lat = pair.split(",")
+            points.append((float(lat), float(lon)))
+        return points
+
+    def seconds_between(a, b) -> float:
+        km = math.dist(a, b) * 111.0
+        return km / 25.0 * 3600  # ~25 km/h trong nội thành
+
+    class OSRMHandler(_Handler):
+        def do_GET(self):
+            with stats:
+                time.sleep(latency)
+                url = urlsplit(self.path)  # urlparse cắt mất phần sau ";" (path params)
+                try:
+                    points = coords_from_path(url.path)
+                except ValueError:
+                    self._send_json({"code": "InvalidQuery"}, status=400)
+                    return
+
+                if "/table/" in url.path:
+                    params = parse_qs(url.query)
+                    sources = [int(i) for i in params.get("sources", [""])[0].split(";") if i] or range(len(points))
+                    destinations = [int(i) for i in params.get("destinations", [""])[0].split(";") if i] or range(len(points))
+                    durations = [[seconds_between(points[s], points[d]) for d in destinations] for s in sources]
+                    self._send_json({"code": "Ok", "durations": durations})
+                    return
+
+                distance = sum(math.dist(a, b) for a, b in zip(points, points[1:])) * 111.0 * 1000
+                self._send_json({
+                    "code": "Ok",
+                    "routes": [{
+                        "geometry": {"type": "LineString", "coordinates": [[p[1], p[0]] for p in points]},
+                        "distance": distance,
+                        "duration": distance / 1000 / 25.0 * 3600,
+                    }],
+                })
+
+    return OSRMHandler
+
+
+def fake_intent(user_message: str) -> dict:
+    """Cheap stand-in for the LLM's intent extraction."""
+    low = user_message.lower()
+    if any(w in low for w in ["chào", "hello", "hi"]):
+        return {"intent": "greeting", "entities": {}}
+    words = low.replace("tìm", "").replace("quán", "").split()
+    return {"intent": "search_place", "entities": {"keyword": words[-1] if words else "", "category": "Ăn uống"}}
+
+
+def _keep_alive_seconds(value) -> float:
+    """Parse Ollama's keep_alive ("30m", "10s", "1h", seconds as number); default 5 minutes."""
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def _ollama_handler(latency: float, token_latency: float, parallel: int, cold_start: float, stats: StandinStats):
+    # Ollama thật chỉ xử lý được vài request cùng lúc -> giả lập bằng semaphore
+    slots = threading.Semaphore(parallel) if parallel > 0 else None
+    # Model chưa nằm trong RAM thì request đầu phải chờ load (cold_start giây)
+    model_state = {"loaded_until": 0.0}
+    model_lock = threading.Lock()
+
+    def ensure_model_loaded(keep_alive):
+        with model_lock:
+            if time.time() > model_state["loaded_until"]:
+                time.sleep(cold_start)
+            model_state["loaded_until"] = time.time() + _keep_alive_seconds(keep_alive)
+
+    class OllamaHandler(_Handler):
+        def do_POST(self):
+            with stats:
+                try:
+                    request = json.loads(self._read_body() or b"{}")
+                except ValueError:
+                    request = {}
+                if slots:
+                    slots.acquire()
+                try:
+                    self._respond(request)
+                finally:
+                    if slots:
+                        slots.release()
+
+        def _respond(self, request: dict):
+            ensure_model_loaded(request.get("keep_alive"))
+            time.sleep(latency)
+            messages = request.get("messages") or [{"content": request.get("prompt", "")}]
+            content = json.dumps(fake_intent(messages[-1].get("content", "")), ensure_ascii=False)
+            key = "message" if self.path.endswith("/chat") else "response"
+
+            def chunk(text: str, done: bool) -> dict:
+                payload = {"model": request.get("model", ""), "done": done}
+                payload[key] = {"role": "assistant", "content": text} if key == "message" else text
+                return payload
+
+            if request.get("stream") is False:
+                time.sleep(token_latency * len(content) / 4)
+                self._send_json(chunk(content, True))
+                return
+
+            # Streaming: NDJSON, ~4 ký tự mỗi token
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            tokens = [content[i:i + 4] for i in range(0, len(content), 4)] + [""]
+            for i, token in enumerate(tokens):
+                time.sleep(token_latency)
+                line = (json.dumps(chunk(token, i == len(tokens) - 1)) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return OllamaHandler
+
+
+class Standins:
+    """Overpass, OSRM and Ollama stand-ins running on background threads."""
+
+    def __init__(self, host: str = "127.0.0.1", port_base: int = 9100,
+                 overpass_latency: float = 0.3, overpass_elements: int = 120,
+                 osrm_latency: float = 0.05,
+                 ollama_latency: float = 0.2, ollama_token_latency: float = 0.02, ollama_parallel: int = 1,
+                 ollama_cold_start: float = 0.0):
+        self.stats = {name: StandinStats() for name in ("overpass", "osrm", "ollama")}
+        handlers = {
+            "overpass": _overpass_handler(overpass_latency, overpass_elements, self.stats["overpass"]),
+            "osrm": _osrm_handler(osrm_latency, self.stats["osrm"]),
+            "ollama": _ollama_handler(ollama_latency, ollama_token_latency, ollama_parallel, ollama_cold_start,
+                                      self.stats["ollama"]),
+        }
+        self.servers = {}
+        for offset, (name, handler) in enumerate(handlers.items(), start=1):
+            server = ThreadingHTTPServer((host, port_base + offset), handler)
+            server.daemon_threads = True
+            self.servers[name] = server
+        self.host = host
+
+    def url(self, name: str) -> str:
+        return f"http://{self.host}:{self.servers[name].server_address[1]}"
+
+    def env(self) -> dict:
+        """Environment variables pointing backend + chatbot at these stand-ins."""
+        return {
+            "EAT_CHILL_OVERPASS_URL": f"{self.url('overpass')}/api/interpreter",
+            "EAT_CHILL_OSRM_URL": self.url("osrm"),
+            "OLLAMA_HOST": self.url("ollama"),
+        }
+
+    def start(self):
+        for server in self.servers.values():
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def snapshot(self) -> dict:
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+    def reset_peaks(self):
+        for stats in self.stats.values():
+            stats.reset_peak()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Overpass/OSRM/Ollama stand-ins")
+    parser.add_argument("--port-base", type=int, default=9100)
+    parser.add_argument("--overpass-latency", type=float, default=0.3)
+    parser.add_argument("--overpass-elements", type=int, default=120)
+    parser.add_argument("--osrm-latency", type=float, default=0.05)
+    parser.add_argument("--ollama-latency", type=float, default=0.2)
+    parser.add_argument("--ollama-token-latency", type=float, default=0.02)
+    parser.add_argument("--ollama-parallel", type=int, default=1)
+    parser.add_argument("--ollama-cold-start", type=float, default=0.0, help="model load time when not resident")
+    args = parser.parse_args()
+
+    standins = Standins(port_base=args.port_base,
+                        overpass_latency=args.overpass_latency, overpass_elements=args.overpass_elements,
+                        osrm_latency=args.osrm_latency,
+                        ollama_latency=args.ollama_latency, ollama_token_latency=args.ollama_token_latency,
+                        ollama_parallel=args.ollama_parallel, ollama_cold_start=args.ollama_cold_start).start()
+    for key, value in standins.env().items():
+        print(f"{key}={value}")
+    try:
+        while True:
+            time.sleep(5)
+            print(json.dumps(standins.snapshot()))
+    except KeyboardInterrupt:
+        standins.stop()
+
+
+if __name__ == "__main__":
+    main()